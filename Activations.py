@@ -0,0 +1,51 @@
+import numpy as np
+
+def sigmoid(values: np.ndarray) -> np.ndarray:
+    """ logistic activation applied to a whole array of pre-activations """
+    return 1 / (1 + np.exp(-values))
+
+def neat_sigmoid(values: np.ndarray) -> np.ndarray:
+    """ steepened sigmoid from the original NEAT paper, close to linear around 0 for small weights """
+    return 1 / (1 + np.exp(-4.9 * values))
+
+def relu(values: np.ndarray) -> np.ndarray:
+    """ rectified linear activation """
+    return np.maximum(values, 0)
+
+# every activation works on whole arrays of node pre-activations at once
+ACTIVATIONS = {
+    "sigmoid": sigmoid,
+    "tanh": np.tanh,
+    "relu": relu,
+    "neat_sigmoid": neat_sigmoid,
+}
+
+class LookupTable:
+    """
+    an activation sampled once over a fixed range, evaluated by indexing the nearest sample
+    only for activations that flatten out, values beyond the range take the value at its edge
+    """
+    def __init__(self, function, limit: float = 8.0, size: int = 4096):
+        self.scale = (size - 1) / (2 * limit)
+        # shift so truncating the scaled value rounds it to the nearest sample
+        self.offset = limit * self.scale + 0.5
+        self.table = function(np.linspace(-limit, limit, size))
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        index = values * self.scale
+        index += self.offset
+        np.clip(index, 0, len(self.table) - 1, out=index)
+        return self.table.take(index.astype(np.intp))
+
+# saturating activations that can be replaced by a lookup table, built once and shared by every network
+lookup_tables = {name: None for name in ("sigmoid", "tanh", "neat_sigmoid")}
+
+def get_activation(name: str, lookup: bool = False):
+    """ get an activation function by name, or its lookup table if it has one and lookup is set """
+    if name not in ACTIVATIONS:
+        raise ValueError(f"unknown activation {name!r}, expected one of {list(ACTIVATIONS)}")
+    if not lookup or name not in lookup_tables:
+        return ACTIVATIONS[name]
+    if lookup_tables[name] is None:
+        lookup_tables[name] = LookupTable(ACTIVATIONS[name])
+    return lookup_tables[name]
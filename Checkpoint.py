@@ -0,0 +1,112 @@
+import os
+import random
+import numpy as np
+
+from NEAT import GENE_DTYPE, NEAT, Agent
+
+# NEAT attributes saved alongside the population
+HYPERPARAMETERS = [
+    "node_mutation_rate",
+    "connection_mutation_rate",
+    "kill_off_rate",
+    "speciation_weights",
+    "speciation_threshold",
+    "elitism",
+    "tournament_size",
+    "crossover_rate",
+]
+
+def save_checkpoint(neat: NEAT, path: str, generation: int) -> None:
+    """
+    save the full state of a NEAT run as packed arrays in an uncompressed .npz file
+    the file is written next to path first and then moved over it, so a crash never leaves half a checkpoint
+    """
+    agents = neat.agents
+    gene_counts = [len(agent.genes) for agent in agents]
+
+    # species are stored as indices into the agents
+    agent_index = {id(agent): i for i, agent in enumerate(agents)}
+    species_members = [agent_index[id(agent)] for specie in neat.species for agent in specie]
+    species_sizes = [len(specie) for specie in neat.species]
+
+    # representatives are frozen clones, so their genes are stored on their own
+    representatives = neat.representatives
+
+    # innovation registry: its reverse index and this generation's node splits
+    innovations = neat.innovations
+    node_splits = np.array(list(innovations.node_splits.items()), dtype=np.int64).reshape(-1, 2)
+
+    # python's random module drives every mutation
+    rng_version, rng_state, rng_gauss = random.getstate()
+
+    arrays = {
+        "generation": np.array(generation),
+        "shape": np.array([neat.num_agents, neat.num_inputs, neat.num_outputs, innovations.current_innovation, innovations.next_node]),
+        "genes": np.concatenate([agent.genes for agent in agents]) if agents else np.empty(0, dtype=GENE_DTYPE),
+        "gene_counts": np.array(gene_counts, dtype=np.int64),
+        "fitness": np.array([agent.fitness for agent in agents], dtype=np.float64),
+        "activations": np.array([agent.activation for agent in agents], dtype=str),
+        "species_members": np.array(species_members, dtype=np.int64),
+        "species_sizes": np.array(species_sizes, dtype=np.int64),
+        "representative_genes": np.concatenate([agent.genes for agent in representatives]) if representatives else np.empty(0, dtype=GENE_DTYPE),
+        "representative_gene_counts": np.array([len(agent.genes) for agent in representatives], dtype=np.int64),
+        "innovation_endpoints": innovations.endpoints[:innovations.current_innovation + 1],
+        "node_splits": node_splits,
+        "rng_state": np.array(rng_state, dtype=np.int64),
+        "rng_info": np.array([rng_version, np.nan if rng_gauss is None else rng_gauss]),
+    }
+    for name in HYPERPARAMETERS:
+        arrays[name] = np.array(getattr(neat, name))
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as checkpoint_file:
+        np.savez(checkpoint_file, **arrays)
+    os.replace(temp_path, path)
+
+def load_checkpoint(path: str) -> (NEAT, int):
+    """ load a NEAT run saved by save_checkpoint, restoring the random state, returns the run and its generation """
+    with np.load(path) as checkpoint:
+        num_agents, num_inputs, num_outputs, current_innovation, next_node = (int(value) for value in checkpoint["shape"])
+
+        # start from an empty population so new attributes keep their defaults
+        neat = NEAT(0, num_inputs, num_outputs)
+        neat.num_agents = num_agents
+        for name in HYPERPARAMETERS:
+            value = checkpoint[name]
+            setattr(neat, name, value.tolist())
+
+        # rebuild agents from their slice of the packed genes
+        genes = checkpoint["genes"]
+        offsets = np.concatenate(([0], np.cumsum(checkpoint["gene_counts"])))
+        neat.agents = []
+        for i, (fitness, activation) in enumerate(zip(checkpoint["fitness"], checkpoint["activations"].tolist())):
+            agent = Agent(num_inputs, num_outputs, activation)
+            agent.genes = genes[offsets[i]:offsets[i + 1]].copy()
+            agent.fitness = fitness.item()
+            neat.agents.append(agent)
+
+        offsets = np.concatenate(([0], np.cumsum(checkpoint["species_sizes"])))
+        members = checkpoint["species_members"]
+        neat.species = [[neat.agents[i] for i in members[offsets[s]:offsets[s + 1]]] for s in range(len(offsets) - 1)]
+
+        genes = checkpoint["representative_genes"]
+        offsets = np.concatenate(([0], np.cumsum(checkpoint["representative_gene_counts"])))
+        neat.representatives = []
+        for i in range(len(offsets) - 1):
+            agent = Agent(num_inputs, num_outputs)
+            agent.genes = genes[offsets[i]:offsets[i + 1]].copy()
+            neat.representatives.append(agent)
+
+        innovations = neat.innovations
+        innovations.current_innovation = current_innovation
+        innovations.next_node = next_node
+        innovations.endpoints = checkpoint["innovation_endpoints"].copy()
+        innovations.innovations = {(in_node, out_node): innovation for innovation, (in_node, out_node) in enumerate(innovations.endpoints.tolist()) if innovation}
+        innovations.node_splits = dict(checkpoint["node_splits"].tolist())
+
+        rng_version, rng_gauss = checkpoint["rng_info"].tolist()
+        rng_state = tuple(checkpoint["rng_state"].tolist())
+        random.setstate((int(rng_version), rng_state, None if np.isnan(rng_gauss) else rng_gauss))
+
+        generation = int(checkpoint["generation"])
+    return neat, generation
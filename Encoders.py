@@ -0,0 +1,129 @@
+import numpy as np
+
+# x and y movement for each action, matching Game.step
+action_x = np.array([1, -1, 0, 0])
+action_y = np.array([0, 0, 1, -1])
+
+class Encoder:
+    """
+    turns game state into network inputs
+    encoders only read the head, the food and the cells they need, never scanning the whole board
+    incremental encoders can also give just the inputs of the cells a step changed, see encode_cells
+    """
+    incremental = False
+
+    def num_inputs(self, dimensions: (int, int)) -> int:
+        """ number of network inputs for a board of the given dimensions """
+        raise NotImplementedError
+
+    def encode(self, game: 'Game') -> np.ndarray:
+        """ encode a single game """
+        head_x, head_y = game.snake.head()
+        food_x, food_y = game.food
+        arrays = (np.array([head_x]), np.array([head_y]), np.array([food_x]), np.array([food_y]))
+        return self.encode_arrays(game.board[None], *arrays)[0]
+
+    def encode_batch(self, vec_game: 'VecGame') -> np.ndarray:
+        """ encode every env of a VecGame, one row per env """
+        arrays = (vec_game.head_x, vec_game.head_y, vec_game.food_x, vec_game.food_y)
+        return self.encode_arrays(vec_game.board, *(array.astype(np.int64) for array in arrays))
+
+    def encode_arrays(self, boards: np.ndarray, head_x: np.ndarray, head_y: np.ndarray, food_x: np.ndarray, food_y: np.ndarray) -> np.ndarray:
+        """ encode (num_games, height, width) boards with the matching head and food positions """
+        raise NotImplementedError
+
+class BoardEncoder(Encoder):
+    """ the whole flattened board, one input per cell """
+    def num_inputs(self, dimensions: (int, int)) -> int:
+        return dimensions[0] * dimensions[1]
+
+    incremental = True
+
+    def encode(self, game: 'Game') -> np.ndarray:
+        return game.board.flatten()
+
+    def encode_cells(self, game: 'Game', cells: list[int]) -> np.ndarray:
+        """ inputs of the given flat cell indices, which are also their input indices """
+        return game.board.flat[cells]
+
+    def encode_arrays(self, boards, head_x, head_y, food_x, food_y) -> np.ndarray:
+        return boards.reshape(len(boards), -1).astype(np.float64)
+
+class DangerEncoder(Encoder):
+    """
+    danger one step away in each action's direction, which directions lead to the food,
+    and the manhattan distance to the food relative to the board size
+    """
+    def num_inputs(self, dimensions: (int, int)) -> int:
+        return 9
+
+    def encode_arrays(self, boards, head_x, head_y, food_x, food_y) -> np.ndarray:
+        height, width = boards.shape[1:]
+        games = np.arange(len(boards))[:, None]
+
+        # wall or body in the cell next to the head, for each action
+        next_x = head_x[:, None] + action_x
+        next_y = head_y[:, None] + action_y
+        outside = (next_x < 0) | (next_x >= width) | (next_y < 0) | (next_y >= height)
+        cells = boards[games, np.clip(next_y, 0, height - 1), np.clip(next_x, 0, width - 1)]
+        danger = outside | (cells == -1)
+
+        # food direction in action order: right, left, up, down
+        food_dx = food_x - head_x
+        food_dy = food_y - head_y
+        food_direction = np.stack((food_dx > 0, food_dx < 0, food_dy > 0, food_dy < 0), axis=1)
+        food_distance = (np.abs(food_dx) + np.abs(food_dy)) / (width + height)
+
+        return np.concatenate((danger, food_direction, food_distance[:, None]), axis=1).astype(np.float64)
+
+class RayEncoder(Encoder):
+    """
+    rays cast from the head in 8 directions
+    each ray gives the inverse distance to the wall, to the snake's body and to the food, 0 when not seen
+    """
+    directions = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+    def num_inputs(self, dimensions: (int, int)) -> int:
+        return len(self.directions) * 3
+
+    def encode_arrays(self, boards, head_x, head_y, food_x, food_y) -> np.ndarray:
+        height, width = boards.shape[1:]
+        games = np.arange(len(boards))[:, None]
+        distances = np.arange(1, max(width, height) + 1)
+        inputs = np.zeros((len(boards), len(self.directions), 3))
+
+        for i, (x, y) in enumerate(self.directions):
+            # cells along the ray until it leaves the board
+            ray_x = head_x[:, None] + x * distances
+            ray_y = head_y[:, None] + y * distances
+            inside = (ray_x >= 0) & (ray_x < width) & (ray_y >= 0) & (ray_y < height)
+            cells = boards[games, np.clip(ray_y, 0, height - 1), np.clip(ray_x, 0, width - 1)]
+            cells = np.where(inside, cells, 0)
+
+            # the first cell outside the board is the wall
+            inputs[:, i, 0] = 1 / (np.argmin(inside, axis=1) + 1)
+            for channel, value in ((1, -1), (2, 1)):
+                hit = cells == value
+                seen = hit.any(axis=1)
+                inputs[seen, i, channel] = 1 / distances[np.argmax(hit[seen], axis=1)]
+
+        return inputs.reshape(len(boards), -1)
+
+class WindowEncoder(Encoder):
+    """ the square of cells around the head, cells beyond the walls count as snake """
+    def __init__(self, radius: int = 2):
+        self.radius = radius
+
+    def num_inputs(self, dimensions: (int, int)) -> int:
+        return (2 * self.radius + 1) ** 2
+
+    def encode_arrays(self, boards, head_x, head_y, food_x, food_y) -> np.ndarray:
+        height, width = boards.shape[1:]
+        games = np.arange(len(boards))[:, None, None]
+        offsets = np.arange(-self.radius, self.radius + 1)
+
+        window_x = head_x[:, None, None] + offsets[None, None, :]
+        window_y = head_y[:, None, None] + offsets[None, :, None]
+        inside = (window_x >= 0) & (window_x < width) & (window_y >= 0) & (window_y < height)
+        cells = boards[games, np.clip(window_y, 0, height - 1), np.clip(window_x, 0, width - 1)]
+        return np.where(inside, cells, -1).reshape(len(boards), -1).astype(np.float64)
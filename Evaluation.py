@@ -0,0 +1,203 @@
+import math
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from Encoders import BoardEncoder, Encoder
+from Game import EndReason, Game, VecGame
+from NEAT import Agent
+from Phenotype import Phenotype, PopulationPhenotype
+from Settings import Settings
+
+def play_game(env: Game, phenotype: Phenotype, seed: int) -> (int, EndReason, int):
+    """ play one seeded game with a compiled network and return the points scored, why the game ended and its length in steps """
+    env.reset(seed)
+    phenotype.reset()
+    encoder = env.encoder
+    state = env.observe()
+    while not env.done:
+        action = int(np.argmax(phenotype.forward(state)))
+        env.step(action)
+
+        # board inputs only change in the few cells the step touched
+        if encoder.incremental:
+            phenotype.update_inputs(env.changed_cells, encoder.encode_cells(env, env.changed_cells))
+            state = None
+        else:
+            state = env.observe()
+    return env.points, env.end_reason, env.steps
+
+# game owned by each worker process
+worker_env: Game = None
+worker_shape: (int, int) = None
+worker_network_options: dict = None
+
+def init_worker(dimensions: (int, int), game_options: dict, num_inputs: int, num_outputs: int, network_options: dict) -> None:
+    """ give a worker process its own game, and the options to compile networks with """
+    global worker_env, worker_shape, worker_network_options
+    worker_env = Game(dimensions, **game_options)
+    worker_shape = (num_inputs, num_outputs)
+    worker_network_options = network_options
+
+def play_games(env: Game, phenotype: Phenotype, seeds: list[int]) -> list[tuple[int, EndReason, int]]:
+    """ play one game per seed with the same network """
+    return [play_game(env, phenotype, seed) for seed in seeds]
+
+def evaluate_genomes(jobs: list[tuple[tuple[np.ndarray, np.ndarray, np.ndarray], str, list[int]]]) -> list[list[tuple[int, EndReason, int]]]:
+    """ play a chunk of (genome, activation, seeds) jobs on the worker's game, one game per seed """
+    return [play_games(worker_env, Phenotype(*worker_shape, *genome, activation, **worker_network_options), seeds) for genome, activation, seeds in jobs]
+
+class Evaluator:
+    """
+    plays games with every agent and returns their fitness in order
+    every agent plays the same episodes, seeded seed, seed + 1, ..., so agents are compared on common boards
+    """
+    # ways of turning an agent's episode rewards into its fitness
+    aggregates = ("mean", "min", "quantile")
+
+    def __init__(self, dimensions: (int, int), workers: int = 1, chunk_size: int = None, lockstep: bool = False,
+                 max_steps: int = None, starvation_limit: int = None, detect_loops: bool = False, encoder: Encoder = None,
+                 episodes: int = 1, aggregate: str = "mean", quantile: float = 0.25, settings: Settings = None, cache_size: int = 0):
+        """
+        workers > 1 spreads games over a process pool, each worker owning its own game
+        lockstep plays every game at once with VecGame instead, which has no loop detection,
+        so it needs max_steps or starvation_limit to end games of agents that circle
+        max_steps, starvation_limit and detect_loops bound every game, see Game
+        encoder turns games into network inputs, the flattened board by default
+        episodes is the number of games per agent, aggregated into fitness by their mean, min or a quantile
+        settings give each game's reward from its food, wall and body rewards, otherwise a game is worth its points
+        cache_size keeps the game results of that many (genome, seeds) pairs, so unchanged and duplicate genomes are not played again
+        """
+        if aggregate not in self.aggregates:
+            raise ValueError(f"unknown aggregate {aggregate!r}, expected one of {self.aggregates}")
+        if lockstep and detect_loops:
+            raise ValueError("lockstep games have no loop detection, bound them with max_steps or starvation_limit instead")
+        if lockstep and max_steps is None and starvation_limit is None:
+            raise ValueError("lockstep games need max_steps or starvation_limit, or agents that circle never finish")
+        self.dimensions = dimensions
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.lockstep = lockstep
+        self.encoder = BoardEncoder() if encoder is None else encoder
+        self.game_options = {"max_steps": max_steps, "starvation_limit": starvation_limit, "detect_loops": detect_loops, "encoder": self.encoder}
+        self.env = Game(dimensions, **self.game_options)
+        self.pool: ProcessPoolExecutor = None
+        self.episodes = episodes
+        self.aggregate = aggregate
+        self.quantile = quantile
+        self.settings = settings
+
+        # why each of the last games ended and how many steps it lasted, agent by agent then episode by episode
+        self.end_reasons: list[EndReason] = []
+        self.steps: list[int] = []
+
+        # (num_agents, episodes) rewards of the last evaluation
+        self.rewards: np.ndarray = None
+
+        # least recently used game results by (genome hash, network options, seeds), and the last evaluation's hits
+        self.cache_size = cache_size
+        self.cache: OrderedDict = OrderedDict()
+        self.cache_hits = 0
+        self.cache_lookups = 0
+
+    def evaluate(self, agents: list[Agent], seed: int = 0) -> list[float]:
+        """ play the episodes seeded seed to seed + episodes - 1 with every agent """
+        seeds = list(range(seed, seed + self.episodes))
+        if not self.cache_size:
+            return self.collect(self.play(agents, seeds))
+
+        # games only depend on the network and the seeds, play each distinct uncached genome once
+        evaluation = (Agent.lookup_activations, Agent.recurrent_ticks, tuple(seeds))
+        keys = [(agent.genome_hash(), evaluation) for agent in agents]
+        missing = {}
+        for agent, key in zip(agents, keys):
+            if key not in self.cache and key not in missing:
+                missing[key] = agent
+        self.cache_lookups = len(agents)
+        self.cache_hits = len(agents) - len(missing)
+
+        for key, agent_results in zip(missing, self.play(list(missing.values()), seeds)):
+            self.cache[key] = agent_results
+        results = []
+        for key in keys:
+            self.cache.move_to_end(key)
+            results.append(self.cache[key])
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return self.collect(results)
+
+    def play(self, agents: list[Agent], seeds: list[int]) -> list[list[tuple[int, EndReason, int]]]:
+        """ play every seed with every agent, returns each agent's game results """
+        if not agents:
+            return []
+        if self.lockstep:
+            return self.evaluate_lockstep(agents, seeds)
+        if self.workers > 1:
+            return self.evaluate_parallel(agents, seeds)
+
+        phenotypes = [agent.compile() if agent.phenotype is None else agent.phenotype for agent in agents]
+        return [play_games(self.env, phenotype, seeds) for phenotype in phenotypes]
+
+    def reward(self, points: np.ndarray, end_reasons: np.ndarray) -> np.ndarray:
+        """ reward of games given their points and EndReason values """
+        settings = self.settings
+        if settings is None:
+            return points.astype(np.float64)
+        return (points * settings.food_reward
+                + np.where(end_reasons == EndReason.WALL.value, settings.wall_reward, 0)
+                + np.where(end_reasons == EndReason.BODY.value, settings.body_reward, 0)).astype(np.float64)
+
+    def collect(self, results: list[list[tuple[int, EndReason, int]]]) -> list[float]:
+        """ turn each agent's game results into its fitness, keeping end reasons, steps and rewards """
+        games = [game for agent_results in results for game in agent_results]
+        self.end_reasons = [end_reason for _, end_reason, _ in games]
+        self.steps = [steps for _, _, steps in games]
+
+        points = np.array([points for points, _, _ in games]).reshape(len(results), self.episodes)
+        end_reasons = np.array([end_reason.value for end_reason in self.end_reasons]).reshape(len(results), self.episodes)
+        self.rewards = self.reward(points, end_reasons)
+        if self.aggregate == "min":
+            fitness = self.rewards.min(axis=1)
+        elif self.aggregate == "quantile":
+            fitness = np.quantile(self.rewards, self.quantile, axis=1)
+        else:
+            fitness = self.rewards.mean(axis=1)
+        return fitness.tolist()
+
+    def evaluate_parallel(self, agents: list[Agent], seeds: list[int]) -> list[list[tuple[int, EndReason, int]]]:
+        """ play the agents' games on the process pool, shipping compact genomes instead of agents """
+        if self.pool is None:
+            initargs = (self.dimensions, self.game_options, agents[0].num_inputs, agents[0].num_outputs,
+                        {"lookup": Agent.lookup_activations, "ticks": Agent.recurrent_ticks})
+            self.pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=initargs)
+
+        jobs = [(agent.get_genome(), agent.activation, seeds) for agent in agents]
+        chunk_size = self.chunk_size or math.ceil(len(jobs) / (self.workers * 4))
+        chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+
+        results = []
+        for chunk_results in self.pool.map(evaluate_genomes, chunks):
+            results += chunk_results
+        return results
+
+    def evaluate_lockstep(self, agents: list[Agent], seeds: list[int]) -> list[list[tuple[int, EndReason, int]]]:
+        """
+        play every agent's episodes at the same time with batched inference, env agent * episodes + k plays episode k
+        VecGame boards come from its own random streams, so they are common to all agents but differ from Game's
+        """
+        phenotypes = [agent.compile() if agent.phenotype is None else agent.phenotype for agent in agents]
+        network = PopulationPhenotype([phenotype for phenotype in phenotypes for _ in seeds])
+        env = VecGame(len(agents) * len(seeds), self.dimensions, auto_reset=False, env_seeds=np.tile(seeds, len(agents)),
+                      max_steps=self.game_options["max_steps"], starvation_limit=self.game_options["starvation_limit"])
+        while not env.done.all():
+            actions = np.argmax(network.forward(self.encoder.encode_batch(env)), axis=1)
+            env.step(actions)
+
+        games = [(int(points), EndReason(end_reason), int(steps)) for points, end_reason, steps in zip(env.points, env.end_reason, env.steps)]
+        return [games[i:i + len(seeds)] for i in range(0, len(games), len(seeds))]
+
+    def close(self) -> None:
+        """ shut down the process pool """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -1,70 +1,152 @@
 import numpy as np
-from PIL import Image
-import cv2
-from random import randint
+import random
+from enum import Enum
+
+from Encoders import BoardEncoder, Encoder
+
+class EndReason(Enum):
+    """ why an episode ended """
+    NONE = 0
+    WALL = 1
+    BODY = 2
+    WON = 3
+    MAX_STEPS = 4
+    STARVATION = 5
+    LOOP = 6
 
 class Snake:
-    def __init__(self, x: int, y: int) -> None:
+    def __init__(self, x: int, y: int, capacity: int) -> None:
         """ Init snake """
-        self.body = [ [x, y] ]
-        self.tail_prev_pos = self.body[-1].copy()
+        # body is a preallocated ring buffer of coordinates, head at head_index
+        self.capacity = capacity
+        self.cells = np.zeros((capacity, 2), dtype=np.int16)
+        self.cells[0] = (x, y)
+        self.head_index = 0
+        self.length = 1
+
+    @property
+    def body(self) -> np.ndarray:
+        """ Body coordinates from head to tail """
+        return self.cells[(self.head_index + np.arange(self.length)) % self.capacity]
+
+    def head(self) -> (int, int):
+        """ Position of the snake's head """
+        head_x, head_y = self.cells[self.head_index]
+        return int(head_x), int(head_y)
+
+    def tail(self) -> (int, int):
+        """ Position of the snake's tail """
+        tail_x, tail_y = self.cells[(self.head_index + self.length - 1) % self.capacity]
+        return int(tail_x), int(tail_y)
 
     def move(self, x: int, y: int) -> None:
         """ Move snake """
-        # get save old tail position in case we need to grow
-        self.tail_prev_pos = self.body[-1].copy()
-
-        # move body
-        body = self.body.copy()
-        for i in range(1, len(self.body)):
-            body[i] = self.body[i-1].copy()
-        self.body = body
+        head_x, head_y = self.head()
 
-        # move head
-        self.body[0][0] += x
-        self.body[0][1] += y
+        # new head goes in front of the old one, the tail slot drops off the end
+        self.head_index = (self.head_index - 1) % self.capacity
+        self.cells[self.head_index] = (head_x + x, head_y + y)
 
     def grow(self):
         """ Grow snake """
-        self.body.append(self.tail_prev_pos)
+        # the old tail is still stored right behind the body, keep it
+        if self.length < self.capacity:
+            self.length += 1
 
 class Game:
-    def __init__(self, dimensions: (int, int)) -> None:
-        """ Init the game of snake """
+    def __init__(self, dimensions: (int, int), seed: int = None, max_steps: int = None, starvation_limit: int = None, detect_loops: bool = False,
+                 encoder: Encoder = None) -> None:
+        """
+        Init the game of snake
+        max_steps caps the length of an episode, starvation_limit caps the steps between two foods
+        detect_loops ends an episode once a (head, direction, food, length) state repeats
+        encoder turns the game into network inputs, the flattened board by default
+        """
         self.dimensions = dimensions
+        self.encoder = BoardEncoder() if encoder is None else encoder
+        self.random = random.Random(seed)
+        self.max_steps = max_steps
+        self.starvation_limit = starvation_limit
+        self.detect_loops = detect_loops
         self.reset()
 
-    def reset(self) -> np.ndarray:
-        """ Reset Game """
-        self.board = np.zeros((self.dimensions[0], self.dimensions[1]))
+    def reset(self, seed: int = None) -> np.ndarray:
+        """ Reset Game, reseeding its random number generator if a seed is given """
+        if seed is not None:
+            self.random.seed(seed)
+        self.board = np.zeros((self.dimensions[1], self.dimensions[0]))
         self.done = False
+        self.end_reason = EndReason.NONE
+        self.steps = 0
+        self.steps_since_food = 0
+        self.seen_states: set[tuple] = set()
+
+        # flat indices (y * width + x) of the cells the last step changed, observe the whole board after a reset
+        self.changed_cells: list[int] = []
+        self.reset_free_cells()
         self.place_snake()
         self.place_food()
         self.points = 0
         return self.board
 
+    def reset_free_cells(self) -> None:
+        """
+        Mark every cell as free
+        free_cells[:num_free] holds the flat index (y * width + x) of each cell without snake or food,
+        free_index maps a cell back to its position in free_cells
+        """
+        num_cells = self.dimensions[0] * self.dimensions[1]
+        self.free_cells = np.arange(num_cells)
+        self.free_index = np.arange(num_cells)
+        self.num_free = num_cells
+
+    def occupy_cell(self, x: int, y: int) -> None:
+        """ Remove a cell from the free cells by swapping it with the last free cell """
+        cell = y * self.dimensions[0] + x
+        index = self.free_index[cell]
+        last_cell = self.free_cells[self.num_free - 1]
+        self.free_cells[index] = last_cell
+        self.free_index[last_cell] = index
+        self.num_free -= 1
+
+    def release_cell(self, x: int, y: int) -> None:
+        """ Add a cell back to the end of the free cells """
+        cell = y * self.dimensions[0] + x
+        self.free_cells[self.num_free] = cell
+        self.free_index[cell] = self.num_free
+        self.num_free += 1
+
     def place_snake(self) -> None:
         """ Place the snake on a random position on the board """
-        snake_x = randint(0, self.dimensions[0] - 1)
-        snake_y = randint(0, self.dimensions[1] - 1)
+        snake_x = self.random.randint(0, self.dimensions[0] - 1)
+        snake_y = self.random.randint(0, self.dimensions[1] - 1)
         self.board[snake_y][snake_x] = -1
-        self.snake = Snake(snake_x, snake_y)
+        self.occupy_cell(snake_x, snake_y)
+        self.snake = Snake(snake_x, snake_y, self.dimensions[0] * self.dimensions[1])
 
     def place_food(self) -> None:
         """
-        Place food on a random position on the board
+        Place food on a random free position on the board
         note: snake must be already placed
         """
-        food_x = randint(0, self.dimensions[0] - 1)
-        food_y = randint(0, self.dimensions[1] - 1)
+        # snake fills the whole board, game is won
+        if self.num_free == 0:
+            self.end_reason = EndReason.WON
+            self.done = True
+            return
 
-        # replace food if in snake's body
-        while self.board[food_x][food_y] == -1:
-            food_x = randint(0, self.dimensions[0] - 1)
-            food_y = randint(0, self.dimensions[1] - 1)
+        cell = int(self.free_cells[self.random.randrange(self.num_free)])
+        food_x = cell % self.dimensions[0]
+        food_y = cell // self.dimensions[0]
+        self.occupy_cell(food_x, food_y)
 
         self.board[food_y][food_x] = 1
         self.food = (food_x, food_y)
+        self.changed_cells.append(cell)
+
+    def observe(self) -> np.ndarray:
+        """ Network inputs for the current game state """
+        return self.encoder.encode(self)
 
     def step(self, action: int) -> np.ndarray:
         """ One game step. """
@@ -78,17 +160,40 @@ class Game:
                 y = 1
             case 3: # move down
                 y = -1
+        points = self.points
+        self.changed_cells.clear()
         valid_move = self.move_snake(x, y)
 
+        self.steps += 1
+        self.steps_since_food += 1
+        if self.points > points:
+            self.steps_since_food = 0
+            self.seen_states.clear()
+
         if not valid_move:
             self.done = True
+        elif self.done:
+            pass
+        elif self.max_steps is not None and self.steps >= self.max_steps:
+            self.done = True
+            self.end_reason = EndReason.MAX_STEPS
+        elif self.starvation_limit is not None and self.steps_since_food >= self.starvation_limit:
+            self.done = True
+            self.end_reason = EndReason.STARVATION
+        elif self.detect_loops:
+            # same position, heading, food and length as before means the snake is going in circles
+            state = (self.snake.head(), action, self.food, self.snake.length)
+            if state in self.seen_states:
+                self.done = True
+                self.end_reason = EndReason.LOOP
+            self.seen_states.add(state)
 
         return self.board
 
     def move_snake(self, x: int, y: int) -> bool:
         """ Move the snake horizontally in the x direction and vertically in y """
-        snake_head_x, snake_head_y = self.snake.body[0]
-        snake_tail_x, snake_tail_y = self.snake.body[-1]
+        snake_head_x, snake_head_y = self.snake.head()
+        snake_tail_x, snake_tail_y = self.snake.tail()
 
         # find new head position on board
         new_snake_head_x = snake_head_x + x
@@ -96,49 +201,259 @@ class Game:
 
         # check for horizontal wall collisions
         if new_snake_head_x >= self.dimensions[0] or new_snake_head_x < 0:
+            self.end_reason = EndReason.WALL
             return False
 
         # check for vertical wall collisions
         if new_snake_head_y >= self.dimensions[1] or new_snake_head_y < 0:
+            self.end_reason = EndReason.WALL
             return False
 
         # check for collisions vs own body
         new_head_position = self.board[new_snake_head_y][new_snake_head_x]
         if new_head_position == -1:
+            self.end_reason = EndReason.BODY
             return False
 
         # if no collision, move snake
         self.snake.move(x, y)
         self.board[new_snake_head_y][new_snake_head_x] = -1
+        self.changed_cells.append(new_snake_head_y * self.dimensions[0] + new_snake_head_x)
 
         # if we ate food, grow snake and dont update tail's position
         if new_head_position == 1:
             self.snake.grow()
-            self.place_food()
             self.points += 1
+            self.place_food()
             return True
 
         # if food not eaten, move the tail
         self.board[snake_tail_y][snake_tail_x] = 0
+        self.changed_cells.append(snake_tail_y * self.dimensions[0] + snake_tail_x)
+        self.release_cell(snake_tail_x, snake_tail_y)
+        self.occupy_cell(new_snake_head_x, new_snake_head_y)
         return True
 
-    def render(self) -> None:
+    # BGR colours for cv2, indexed by board value + 1: snake, empty, food
+    palette = np.array([(255, 175, 0), (0, 0, 0), (0, 0, 255)], dtype=np.uint8)
+
+    def frame(self, scale: int = 30) -> np.ndarray:
+        """ Image of the board with every cell upscaled to a scale x scale block, nearest neighbour """
+        colors = self.palette[(self.board + 1).astype(np.intp)]
+        return colors.repeat(scale, axis=0).repeat(scale, axis=1)
+
+    def render(self, scale: int = 30) -> None:
+        """ Show the board in an OpenCV window, only needed by whoever displays games """
+        import cv2
+
         if self.done:
             return
         else:
             if cv2.waitKey(1) & 0xFF == ord("q"):
                 return
 
-        board = np.zeros((self.dimensions[0], self.dimensions[1], 3), dtype=np.uint8)
-        food_color = (0, 0, 255)
-        snake_color = (255, 175, 0)
+        cv2.imshow("Snake", self.frame(scale))
+
+def splitmix64(state: np.ndarray) -> np.ndarray:
+    """ SplitMix64 output function, turns consecutive counter values into independent looking 64 bit integers """
+    state = (state ^ (state >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    state = (state ^ (state >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return state ^ (state >> np.uint64(31))
+
+class VecGame:
+    """
+    many games of snake stepped together in lockstep
+    boards share one (num_envs, height, width) tensor: -1 for snake, 1 for food
+    step budgets work as in Game, loop detection is only available on Game
+    every env draws from its own counter based random stream, so envs given the same seed play the same boards
+    for as long as their snakes move the same way
+    """
+    # x and y movement for each action, matching Game.step
+    action_x = np.array([1, -1, 0, 0], dtype=np.int16)
+    action_y = np.array([0, 0, 1, -1], dtype=np.int16)
+
+    # SplitMix64 increment between two draws of a random stream
+    random_increment = np.uint64(0x9E3779B97F4A7C15)
+
+    def __init__(self, num_envs: int, dimensions: (int, int), auto_reset: bool = True, seed: int = None, max_steps: int = None, starvation_limit: int = None,
+                 env_seeds: np.ndarray = None) -> None:
+        """
+        Init num_envs games of snake
+        env_seeds gives each env's random stream its seed, otherwise they are drawn from seed
+        """
+        self.num_envs = num_envs
+        self.dimensions = dimensions
+        self.width, self.height = dimensions
+        self.auto_reset = auto_reset
+        self.max_steps = max_steps
+        self.starvation_limit = starvation_limit
+        if env_seeds is None:
+            env_seeds = np.random.default_rng(seed).integers(0, 2 ** 63, size=num_envs)
+        self.random_state = splitmix64(np.asarray(env_seeds).astype(np.uint64))
+
+        num_cells = self.width * self.height
+        self.board = np.zeros((num_envs, self.height, self.width), dtype=np.int8)
+        self.cells = self.board.reshape(num_envs, num_cells)
+
+        # snake bodies are ring buffers of flat cell indices, head at head_index
+        self.body = np.zeros((num_envs, num_cells), dtype=np.int32)
+        self.head_index = np.zeros(num_envs, dtype=np.int32)
+        self.length = np.ones(num_envs, dtype=np.int32)
+        self.head_x = np.zeros(num_envs, dtype=np.int16)
+        self.head_y = np.zeros(num_envs, dtype=np.int16)
+        self.food_x = np.zeros(num_envs, dtype=np.int16)
+        self.food_y = np.zeros(num_envs, dtype=np.int16)
+        self.points = np.zeros(num_envs, dtype=np.int32)
+        self.done = np.zeros(num_envs, dtype=bool)
+        self.steps = np.zeros(num_envs, dtype=np.int32)
+        self.steps_since_food = np.zeros(num_envs, dtype=np.int32)
+
+        # EndReason value of each env's episode
+        self.end_reason = np.zeros(num_envs, dtype=np.int8)
+
+        # free cells of each env, as in Game.reset_free_cells
+        self.free_cells = np.zeros((num_envs, num_cells), dtype=np.int32)
+        self.free_index = np.zeros((num_envs, num_cells), dtype=np.int32)
+        self.num_free = np.zeros(num_envs, dtype=np.int32)
+
+        # score and EndReason value of each env's last finished episode, for auto reset envs
+        self.episode_points = np.zeros(num_envs, dtype=np.int32)
+        self.episode_end_reason = np.zeros(num_envs, dtype=np.int8)
+        self.reset()
+
+    def reset(self, envs: np.ndarray = None) -> np.ndarray:
+        """ Reset the given envs, or every env """
+        if envs is None:
+            envs = np.arange(self.num_envs)
+        self.cells[envs] = 0
+        self.done[envs] = False
+        self.end_reason[envs] = EndReason.NONE.value
+        self.steps[envs] = 0
+        self.steps_since_food[envs] = 0
+        self.points[envs] = 0
+        self.free_cells[envs] = np.arange(self.width * self.height)
+        self.free_index[envs] = np.arange(self.width * self.height)
+        self.num_free[envs] = self.width * self.height
+        self.place_snake(envs)
+        self.place_food(envs)
+        return self.board
+
+    def random(self, envs: np.ndarray) -> np.ndarray:
+        """ Next uniform value in [0, 1) from each env's random stream """
+        self.random_state[envs] += self.random_increment
+        return (splitmix64(self.random_state[envs]) >> np.uint64(11)) * 2.0 ** -53
+
+    def place_snake(self, envs: np.ndarray) -> None:
+        """ Place a new snake on a random position of each env's board """
+        cell = (self.random(envs) * (self.width * self.height)).astype(np.int32)
+        self.head_index[envs] = 0
+        self.length[envs] = 1
+        self.body[envs, 0] = cell
+        self.head_x[envs] = cell % self.width
+        self.head_y[envs] = cell // self.width
+        self.cells[envs, cell] = -1
+        self.occupy_cells(envs, cell)
+
+    def occupy_cells(self, envs: np.ndarray, cells: np.ndarray) -> None:
+        """ Remove one cell from each env's free cells by swapping it with the last free cell """
+        index = self.free_index[envs, cells]
+        last = self.num_free[envs] - 1
+        last_cells = self.free_cells[envs, last]
+        self.free_cells[envs, index] = last_cells
+        self.free_index[envs, last_cells] = index
+        self.num_free[envs] = last
+
+    def release_cells(self, envs: np.ndarray, cells: np.ndarray) -> None:
+        """ Add one cell back to the end of each env's free cells """
+        last = self.num_free[envs]
+        self.free_cells[envs, last] = cells
+        self.free_index[envs, cells] = last
+        self.num_free[envs] = last + 1
+
+    def place_food(self, envs: np.ndarray) -> None:
+        """
+        Place food on a random free position of each env's board
+        note: snakes must be already placed
+        """
+        # snakes that fill the whole board have won
+        full = self.num_free[envs] == 0
+        self.end_reason[envs[full]] = EndReason.WON.value
+        self.done[envs[full]] = True
+        envs = envs[~full]
+        if len(envs) == 0:
+            return
+
+        index = (self.random(envs) * self.num_free[envs]).astype(np.int32)
+        cell = self.free_cells[envs, index]
+        self.occupy_cells(envs, cell)
+
+        self.cells[envs, cell] = 1
+        self.food_x[envs] = cell % self.width
+        self.food_y[envs] = cell // self.width
+
+    def step(self, actions: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        One game step for every env
+        returns the boards and which envs finished an episode on this step
+        """
+        active = ~self.done
+        new_head_x = self.head_x + self.action_x[actions]
+        new_head_y = self.head_y + self.action_y[actions]
+
+        # check for wall collisions
+        wall = (new_head_x < 0) | (new_head_x >= self.width) | (new_head_y < 0) | (new_head_y >= self.height)
+
+        # check for collisions vs own body
+        cell = np.clip(new_head_y, 0, self.height - 1) * self.width + np.clip(new_head_x, 0, self.width - 1)
+        new_head_position = self.cells[np.arange(self.num_envs), cell]
+        crashed = active & (wall | (new_head_position == -1))
+        self.end_reason[crashed] = np.where(wall[crashed], EndReason.WALL.value, EndReason.BODY.value)
+        moving = active & ~crashed
+        ate = moving & (new_head_position == 1)
+
+        # if no collision, move snake heads
+        envs = np.flatnonzero(moving)
+        capacity = self.body.shape[1]
+        self.head_index[envs] = (self.head_index[envs] - 1) % capacity
+        self.body[envs, self.head_index[envs]] = cell[envs]
+        self.cells[envs, cell[envs]] = -1
+        self.head_x[envs] = new_head_x[envs]
+        self.head_y[envs] = new_head_y[envs]
+
+        # if food not eaten, move the tail
+        envs = np.flatnonzero(moving & ~ate)
+        tail_index = (self.head_index[envs] + self.length[envs]) % capacity
+        tail = self.body[envs, tail_index]
+        self.cells[envs, tail] = 0
+        self.release_cells(envs, tail)
+        self.occupy_cells(envs, cell[envs])
+
+        # if we ate food, grow snake and dont update tail's position
+        envs = np.flatnonzero(ate)
+        self.length[envs] += 1
+        self.points[envs] += 1
+        self.place_food(envs)
+
+        self.done |= crashed
 
-        # loop over snake rendering whole body
-        for i in range(len(self.snake.body)):
-            board[self.snake.body[i][1]][self.snake.body[i][0]] = snake_color
+        # step budgets for envs still playing
+        self.steps[active] += 1
+        self.steps_since_food[active] += 1
+        self.steps_since_food[ate] = 0
+        if self.max_steps is not None:
+            out_of_steps = ~self.done & (self.steps >= self.max_steps)
+            self.end_reason[out_of_steps] = EndReason.MAX_STEPS.value
+            self.done |= out_of_steps
+        if self.starvation_limit is not None:
+            starved = ~self.done & (self.steps_since_food >= self.starvation_limit)
+            self.end_reason[starved] = EndReason.STARVATION.value
+            self.done |= starved
 
-        board[self.food[1]][self.food[0]] = food_color
+        finished = active & self.done
+        if self.auto_reset and finished.any():
+            envs = np.flatnonzero(finished)
+            self.episode_points[envs] = self.points[envs]
+            self.episode_end_reason[envs] = self.end_reason[envs]
+            self.reset(envs)
 
-        img = Image.fromarray(board, "RGB")
-        img = img.resize((300,300))
-        cv2.imshow("Snake", np.array(img))
+        return self.board, finished
@@ -1,291 +1,330 @@
+import hashlib
 import random
 import numpy as np
-from collections import deque
 from enum import Enum
 
-import copy
+from Phenotype import Phenotype, PopulationPhenotype
+from Speciation import Speciator
+from Telemetry import Telemetry
 
 class NodeType(Enum):
     INPUT = 1
     OUTPUT = 2
     HIDDEN = 3
 
-class Node:
-    """ class for a NEAT node """
-    def __init__(self, identification: int, node_type: NodeType):
-        self.value = 0
-        self.activated = False
-        self.id = identification
-        self.node_type = node_type
-        self.in_connections: set[int] = set()
-        self.out_connections: set[int] = set()
-
-    def activation(self, value: int) -> int:
-        return 1 / (1 + np.exp(-value))
-
-class Connection:
-    """ class for connections between nodes """
-    def __init__(self, in_node: Node, out_node: Node, innovation_number: int):
-        self.in_node = in_node
-        self.out_node = out_node
-        self.innovation_number = innovation_number;
-        self.weight = random.uniform(-2, 2)
-        self.enabled = True
+# one row per connection gene, signal flows from out_node into in_node
+GENE_DTYPE = np.dtype([
+    ("innovation", np.int64),
+    ("out_node", np.int64),
+    ("in_node", np.int64),
+    ("weight", np.float64),
+    ("enabled", np.bool_),
+])
+
+class InnovationRegistry:
+    """
+    global record of structural innovations, owned by NEAT and shared by every agent
+    connections get one innovation number per (in node, out node) pair for the whole run,
+    a connection split during a generation gives every agent splitting it the same new node
+    """
+    def __init__(self, first_hidden_node: int):
+        self.current_innovation = 0
+        self.next_node = first_hidden_node
+        self.innovations: dict[tuple[int, int], int] = {}
+
+        # reverse index: row i holds the (in node, out node) of innovation i
+        self.endpoints = np.zeros((64, 2), dtype=np.int64)
+
+        # splits made this generation: innovation of the split connection -> new node id
+        self.node_splits: dict[int, int] = {}
+
+    def new_generation(self):
+        """ forget this generation's node splits, so later splits create new nodes """
+        self.node_splits = {}
+
+    def get_innovation(self, in_node: int, out_node: int) -> int:
+        """ get the innovation number for a connection from out node into in node, registering it if new """
+        innovation_number = self.innovations.get((in_node, out_node))
+        if innovation_number is not None:
+            return innovation_number
+
+        # new innovation!
+        self.current_innovation += 1
+        innovation_number = self.current_innovation
+        self.innovations[(in_node, out_node)] = innovation_number
+        if innovation_number >= len(self.endpoints):
+            self.endpoints = np.concatenate((self.endpoints, np.zeros_like(self.endpoints)))
+        self.endpoints[innovation_number] = (in_node, out_node)
+        return innovation_number
+
+    def split_node(self, innovation_number: int, node_ids: np.ndarray) -> int:
+        """ get the node created by splitting a connection this generation, or a new node if the agent already has it """
+        node_id = self.node_splits.get(innovation_number)
+        if node_id is None or node_id in node_ids:
+            node_id = self.next_node
+            self.next_node += 1
+            self.node_splits[innovation_number] = node_id
+        return node_id
+
+    def get_endpoints(self, innovation_numbers: np.ndarray) -> (np.ndarray, np.ndarray):
+        """ get the in nodes and out nodes of the given innovations """
+        endpoints = self.endpoints[innovation_numbers]
+        return endpoints[:, 0], endpoints[:, 1]
 
 class Agent:
-    """ class for a neat agent """
-    def __init__(self, num_inputs: int, num_outputs: int):
+    """
+    class for a neat agent
+    node id's start at 1: inputs, then outputs, hidden nodes have id's from the innovation registry
+    connection genes live in one structured array sorted by innovation number
+    """
+    # chance a matching gene disabled in either parent is disabled in their child
+    disabled_gene_rate = 0.75
+
+    # compile networks with activation lookup tables instead of the exact functions, for cheaper inference
+    lookup_activations = False
+
+    # synchronous updates per game step for recurrent networks that keep node values between steps, None for feed forward
+    recurrent_ticks: int = None
+
+    def __init__(self, num_inputs: int, num_outputs: int, activation: str = "sigmoid"):
         self.num_inputs = num_inputs
         self.num_outputs = num_outputs
-        self.nodes: dict[int, Node] = {}
-        self.create_initial_nodes(num_inputs, num_outputs)
-        self.connections: dict[int, Connection] = {}
+        self.activation = activation
+        self.genes = np.empty(0, dtype=GENE_DTYPE)
         self.fitness = 0
-
-    def get_action(self, state, neat_connections: dict[int, dict[int, int]]):
+        self.phenotype: Phenotype = None
+
+    def clone(self) -> 'Agent':
+        """ copy the agent, its genes are copied in a single buffer copy """
+        clone = Agent.__new__(Agent)
+        clone.num_inputs = self.num_inputs
+        clone.num_outputs = self.num_outputs
+        clone.activation = self.activation
+        clone.genes = self.genes.copy()
+        clone.fitness = self.fitness
+
+        # the compiled network only depends on the genes, share it until either agent mutates
+        clone.phenotype = self.phenotype
+        return clone
+
+    def crossover(self, other_agent: 'Agent') -> 'Agent':
+        """
+        create a child from this agent and another, with genes aligned by innovation number
+        matching genes come from either parent at random, disjoint and excess genes from the fitter parent,
+        or from each parent at random when both are equally fit
+        """
+        if self.fitness >= other_agent.fitness:
+            fitter_agent, other_parent = self, other_agent
+        else:
+            fitter_agent, other_parent = other_agent, self
+
+        # child starts as the fitter parent's genes, matching genes share their end nodes in both parents
+        child = Agent.__new__(Agent)
+        child.num_inputs = self.num_inputs
+        child.num_outputs = self.num_outputs
+        child.activation = fitter_agent.activation
+        child.genes = fitter_agent.genes.copy()
+        child.fitness = 0
+        child.phenotype = None
+
+        _, joint, other_joint = np.intersect1d(fitter_agent.genes["innovation"], other_parent.genes["innovation"], assume_unique=True, return_indices=True)
+        if len(joint):
+            # inherit each matching gene's weight from a random parent
+            from_other = np.array([random.random() < 0.5 for _ in range(len(joint))], dtype=bool)
+            child.genes["weight"][joint[from_other]] = other_parent.genes["weight"][other_joint[from_other]]
+
+            # a gene disabled in either parent is likely to stay disabled
+            disabled = ~fitter_agent.genes["enabled"][joint] | ~other_parent.genes["enabled"][other_joint]
+            stays_disabled = np.array([random.random() < self.disabled_gene_rate for _ in range(len(joint))], dtype=bool)
+            child.genes["enabled"][joint] = ~(disabled & stays_disabled)
+
+        if self.fitness == other_agent.fitness:
+            # keep or drop each of the first parent's unmatched genes, and take each of the other's, with even odds
+            kept = np.array([random.random() < 0.5 for _ in range(len(child.genes))], dtype=bool)
+            kept[joint] = True
+            taken = np.array([random.random() < 0.5 for _ in range(len(other_parent.genes))], dtype=bool)
+            taken[other_joint] = False
+            genes = np.concatenate((child.genes[kept], other_parent.genes[taken]))
+            child.genes = genes[np.argsort(genes["innovation"], kind="stable")]
+        return child
+
+    def get_action(self, state) -> int:
         """ get an action from the agent given a current game state """
-        node_queue = deque()
-
-        # ith input = ith input node value
-        for i in range(0, self.num_inputs):
-            node = self.nodes[i+1] # node id's start at 1, not 0
-            node.value = state[i]
-
-            # add nodes current node is connected to into queue
-            for in_node_id in node.out_connections:
-                in_node = self.nodes[in_node_id]
-                node_queue.append(in_node)
-
-        # process nodes in queue
-        self.process_nodes(node_queue, neat_connections)
+        if self.phenotype is None:
+            self.compile()
 
         # select index of output node with largest value
-        action = max(range(len(self.output_nodes)), key=lambda i: self.output_nodes[i].value)
-
-        # reset nodes
-        for node_id, node in self.nodes.items():
-            node.activated = False
-
-        return action
-
-    def process_nodes(self, node_queue: deque[Node], neat_connections: dict[int, dict[int,int]]):
-        """ forward propate and process nodes breath first """
-        if len(node_queue) == 0:
-            return node_queue
-
-        # get current node
-        node = node_queue.popleft()
-
-        # check if already processed
-        if node.activated:
-            return self.process_nodes(node_queue, neat_connections)
-
-        # get nodes value
-        total_value = 0
-        for out_node_id in node.in_connections:
-            connection_id = neat_connections[out_node_id][node.id]
-            connection = self.connections[connection_id]
-            total_value += connection.weight * connection.in_node.value
-
-        node.value = node.activation(total_value)
-        node.activated = True
-
-        # add nodes current node is connected to into queue
-        for in_node_id in node.out_connections:
-            in_node = self.nodes[in_node_id]
-            if not in_node.activated:
-                node_queue.append(in_node)
-
-        return self.process_nodes(node_queue, neat_connections)
-
-    def create_initial_nodes(self, num_inputs: int, num_outputs: int):
-        """ create input and output nodes """
-        self.output_nodes = []
-        for i in range(1, num_inputs+1):
-            self.nodes[i] = Node(i, NodeType.INPUT)
-        for i in range(1, num_outputs+1):
-            output_node = Node(i+num_inputs, NodeType.OUTPUT)
-            self.nodes[i+num_inputs] = output_node
-            self.output_nodes.append(output_node)
-
-    def add_connection(self, neat_connections: dict[int, dict[int, dict[int,int]]], current_innovation: int) -> int:
+        return int(np.argmax(self.phenotype.forward(state)))
+
+    def compile(self) -> Phenotype:
+        """ build the flat evaluation plan for the agent's current genome """
+        self.phenotype = Phenotype(self.num_inputs, self.num_outputs, *self.get_genome(), self.activation, self.lookup_activations, self.recurrent_ticks)
+        return self.phenotype
+
+    def get_genome(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        """ get the enabled connections as compact out node, in node and weight arrays """
+        genes = self.genes[self.genes["enabled"]]
+        return genes["out_node"], genes["in_node"], genes["weight"]
+
+    def genome_hash(self) -> bytes:
+        """ content hash of the activation and enabled connections, equal for agents whose networks are identical """
+        digest = hashlib.blake2b(self.activation.encode(), digest_size=16)
+        for array in self.get_genome():
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.digest()
+
+    def get_node_type(self, node_id: int) -> NodeType:
+        """ get the type of a node from its id """
+        if node_id <= self.num_inputs:
+            return NodeType.INPUT
+        if node_id <= self.num_inputs + self.num_outputs:
+            return NodeType.OUTPUT
+        return NodeType.HIDDEN
+
+    def add_gene(self, innovation_number: int, out_node: int, in_node: int, weight: float):
+        """ add an enabled connection gene, keeping genes sorted by innovation number """
+        index = np.searchsorted(self.genes["innovation"], innovation_number)
+        gene = (innovation_number, out_node, in_node, weight, True)
+
+        # a connection that was disabled before is replaced
+        if index < len(self.genes) and self.genes["innovation"][index] == innovation_number:
+            self.genes[index] = gene
+        else:
+            self.genes = np.insert(self.genes, index, gene)
+
+    def has_connection(self, in_node: int, out_node: int) -> bool:
+        """ check for an enabled connection from out node into in node """
+        genes = self.genes
+        return bool(np.any((genes["in_node"] == in_node) & (genes["out_node"] == out_node) & genes["enabled"]))
+
+    def get_node_ids(self) -> np.ndarray:
+        """ get the sorted id's of the agent's nodes, every hidden node has at least one gene """
+        io_nodes = np.arange(1, self.num_inputs + self.num_outputs + 1)
+        return np.union1d(io_nodes, np.concatenate((self.genes["out_node"], self.genes["in_node"])))
+
+    def add_connection(self, innovations: InnovationRegistry):
         """ add a connection between two existing nodes """
         # select two nodes
         in_node, out_node = self.get_two_random_nodes()
 
         # check if they already have an existing connection
-        while in_node.id in out_node.out_connections:
+        while self.has_connection(in_node, out_node):
             # reselect nodes until non connected nodes
             in_node, out_node = self.get_two_random_nodes()
 
-        # get innovation number
-        current_innovation, innovation_number = self.update_innovations(in_node, out_node, neat_connections, current_innovation)
-
         # create connection
-        connection = Connection(in_node, out_node, innovation_number)
-        self.connections[innovation_number] = connection
-        self.add_node_connections(in_node, out_node)
-        return current_innovation
-
-    def update_innovations(self, in_node: Node, out_node: Node, neat_connections: dict[int, dict[int,int]], current_innovation: int) -> int:
-        """ updates global neat connections and returns the lastest innovation number and innovation number for this connection"""
-
-        # get innovation number
-        innovation_number = self.get_innovation_number(neat_connections, in_node, out_node, current_innovation)
-
-        # update innovation if new innovation
-        if innovation_number > current_innovation:
-            current_innovation = innovation_number
-
-            # add new innovation to neat connections
-            if out_node.id not in neat_connections:
-                neat_connections[out_node.id] = {in_node.id: innovation_number}
-            else:
-                neat_connections[out_node.id][in_node.id] = innovation_number
-
-        return current_innovation, innovation_number
-
-    def get_innovation_number(self, neat_connections: list[Connection], in_node: Node, out_node: Node, current_innovation: int) -> int:
-        """ get the innovation number for the connection between out node and in node """
-        # check if connection exists
-        if out_node.id in neat_connections:
-            out_node_connections = neat_connections[out_node.id]
-            if in_node.id in out_node_connections.keys():
-                innovation_number = out_node_connections[in_node.id]
-                return innovation_number
-
-        # if connection doesnt exist, then new innovation!
-        return current_innovation + 1
-
-    def get_two_random_nodes(self) -> (Node, Node):
-        """ select two random nodes """
-        node1_id = random.choice(list(self.nodes))
-        node2_id = random.choice(list(self.nodes))
+        innovation_number = innovations.get_innovation(in_node, out_node)
+        self.add_gene(innovation_number, out_node, in_node, random.uniform(-2, 2))
+        self.phenotype = None
+
+    def get_two_random_nodes(self) -> (int, int):
+        """ select two random node id's """
+        node_ids = self.get_node_ids()
+        node1_id = int(random.choice(node_ids))
+        node2_id = int(random.choice(node_ids))
         while node2_id == node1_id:
-            node2_id = random.choice(list(self.nodes))
-        node1 = self.nodes[node1_id]
-        node2 = self.nodes[node2_id]
-        return (node1, node2)
+            node2_id = int(random.choice(node_ids))
+        return (node1_id, node2_id)
 
-    def add_node(self, neat_connections: list[Connection], current_innovation: int):
+    def add_node(self, innovations: InnovationRegistry):
         """
         add a node between two already connected nodes
         disbale the existing connection and add two new connections to and from the new node
         """
+        enabled_genes = np.flatnonzero(self.genes["enabled"])
+
         # if no connections, get random nodes
-        if len(self.connections) == 0:
+        if len(enabled_genes) == 0:
             in_node, out_node = self.get_two_random_nodes()
+            split_innovation = innovations.get_innovation(in_node, out_node)
             from_connection_weight = random.uniform(-2, 2)
             to_connection_weight = random.uniform(-2, 2)
         else: # existing connections
-            # randomly select and existing connection
-            existing_connection_id = random.choice(list(self.connections))
-            existing_connection = self.connections[existing_connection_id]
-            # reselect connection if its disabled
-            while not existing_connection.enabled:
-                existing_connection_id = random.choice(list(self.connections))
-                existing_connection = self.connections[existing_connection_id]
-
-            from_connection_weight = existing_connection.weight
-            to_connection_weight = 1
+            # randomly select an enabled connection
+            existing_connection = random.choice(enabled_genes)
+            split_innovation = int(self.genes["innovation"][existing_connection])
 
-            # disable connection
-            existing_connection.enabled = False
+            from_connection_weight = float(self.genes["weight"][existing_connection])
+            to_connection_weight = 1
 
             # get nodes from existing connection
-            in_node = existing_connection.in_node
-            out_node = existing_connection.out_node
+            in_node = int(self.genes["in_node"][existing_connection])
+            out_node = int(self.genes["out_node"][existing_connection])
 
-            # remove connection info from nodes
-            self.remove_node_connections(in_node, out_node)
+            # disable connection
+            self.genes["enabled"][existing_connection] = False
 
         # create new node
-        node_id = len(self.nodes) + 1
-        new_node = Node(node_id, NodeType.HIDDEN)
-        self.nodes[node_id] = new_node
+        new_node = innovations.split_node(split_innovation, self.get_node_ids())
 
         # create new connection to new node from original out node
-        current_innovation, innovation_number = self.update_innovations(new_node, out_node, neat_connections, current_innovation)
-        to_connection = Connection(new_node, out_node, innovation_number)
-        to_connection.weight = to_connection_weight
-        self.connections[innovation_number] = to_connection
-        self.add_node_connections(new_node, out_node)
+        innovation_number = innovations.get_innovation(new_node, out_node)
+        self.add_gene(innovation_number, out_node, new_node, to_connection_weight)
 
         # create new connection from new node into original in node
-        current_innovation, innovation_number = self.update_innovations(in_node, new_node, neat_connections, current_innovation)
-        from_connection = Connection(in_node, new_node, innovation_number)
-        from_connection.weight = from_connection_weight
-        self.connections[innovation_number] = from_connection
-        self.add_node_connections(in_node, new_node)
-
-        return current_innovation
+        innovation_number = innovations.get_innovation(in_node, new_node)
+        self.add_gene(innovation_number, new_node, in_node, from_connection_weight)
 
-    def add_node_connections(self, in_node: Node, out_node: Node):
-        in_node.in_connections.add(out_node.id)
-        out_node.out_connections.add(in_node.id)
+        self.phenotype = None
 
-    def remove_node_connections(self, in_node: Node, out_node: Node):
-        in_node.in_connections.remove(out_node.id)
-        out_node.out_connections.remove(in_node.id)
+    def get_gene_arrays(self) -> (np.ndarray, np.ndarray):
+        """ get the agent's innovation numbers in ascending order and their matching weights """
+        return self.genes["innovation"], self.genes["weight"]
 
     def get_newest_innovation(self) -> int:
         """ get the number of new innovation the agent has made """
-        newest_innovation = 0
-        for innovation_num in self.connections:
-            newest_innovation = max(innovation_num, newest_innovation)
-        return newest_innovation
+        return int(self.genes["innovation"][-1]) if len(self.genes) else 0
 
-    def speciation_difference(self, other_agent: 'Agent', speciation_threshold, speciation_weights: list[int]) -> bool:
+    def speciation_difference(self, other_agent: 'Agent', speciation_threshold, speciation_weights: list[int]) -> float:
         """ get the speciation difference between the other agent and this one """
+        innovations, weights = self.get_gene_arrays()
+        other_innovations, other_weights = other_agent.get_gene_arrays()
 
-        # get the cutoff point for excess and disjoint genes
+        # joint genes share an innovation number
+        _, joint, other_joint = np.intersect1d(innovations, other_innovations, assume_unique=True, return_indices=True)
+        joint_genes = len(joint)
+
+        # genes newer than the other agent's newest innovation are excess, the remaining unmatched genes are disjoint
         newest_innovation = self.get_newest_innovation()
         other_agent_newest_innovation = other_agent.get_newest_innovation()
-        innovation_cutoff = max(newest_innovation, other_agent_newest_innovation)
-
-        # calc joint, disjoint and excess genes
-        joint_genes = 0
-        joint_genes_weight_diff = 0
-        disjoint_genes = 0
-        excess_genes = 0
-        for inno_num, conn in self.connections.items():
-            if inno_num in other_agent.connections:
-                joint_genes += 1
-                joint_genes_weight_diff += abs(conn.weight - other_agent.connections[inno_num].weight)
-            else:
-                if inno_num > innovation_cutoff:
-                    excess_genes += 1
-                else:
-                    disjoint_genes += 1
-
-        for inno_num, conn in other_agent.connections.items():
-            if inno_num not in other_agent.connections:
-                if inno_num > innovation_cutoff:
-                    excess_genes += 1
-                else:
-                    disjoint_genes += 1
-
+        excess_genes = len(innovations) - np.searchsorted(innovations, other_agent_newest_innovation, side="right")
+        excess_genes += len(other_innovations) - np.searchsorted(other_innovations, newest_innovation, side="right")
+        disjoint_genes = len(innovations) + len(other_innovations) - 2 * joint_genes - excess_genes
 
         # calculate average difference for joint genes
         joint_genes_avg_weight_diff = 0
         if joint_genes:
-            joint_genes_avg_weight_diff = joint_genes_weight_diff / joint_genes
+            joint_genes_avg_weight_diff = np.abs(weights[joint] - other_weights[other_joint]).mean()
 
         # calculate speciation difference
-        most_genes = max(len(self.connections), len(other_agent.connections))
+        most_genes = max(len(innovations), len(other_innovations), 1)
         c1, c2, c3 = speciation_weights
         speciation_difference = (((c1*excess_genes) + (c2*disjoint_genes)) / most_genes ) + c3*joint_genes_avg_weight_diff
-        return speciation_difference
+        return float(speciation_difference)
 
 class NEAT:
-    def __init__(self, num_agents: int, num_inputs: int, num_outputs: int):
-        """ init for neat algorithm """
+    def __init__(self, num_agents: int, num_inputs: int, num_outputs: int, activation: str = "sigmoid"):
+        """
+        init for neat algorithm
+        activation is given to every agent of the first generation, see Activations.ACTIVATIONS,
+        later agents inherit theirs from their parents
+        """
         self.num_agents = num_agents
-        self.connections: dict[int, dict[int, int]] = {}
-        self.current_innovation = 0
-        self.create_agents(num_inputs, num_outputs)
+        self.num_inputs = num_inputs
+        self.num_outputs = num_outputs
+        self.population_phenotype: PopulationPhenotype = None
+        self.innovations = InnovationRegistry(num_inputs + num_outputs + 1)
+
+        self.create_agents(num_inputs, num_outputs, activation)
         self.species = []
 
+        # species keep a frozen representative from one generation to the next
+        self.speciator = Speciator()
+        self.representatives: list[Agent] = []
+
+        # phase timings of next_generation, disabled unless replaced by an enabled Telemetry
+        self.telemetry = Telemetry(enabled=False)
+
         # hyperparameters
         self.node_mutation_rate = 0.1
         self.connection_mutation_rate = 0.1
@@ -293,103 +332,139 @@ class NEAT:
         self.speciation_weights = [0.7, 1.2, 0.3]
         self.speciation_threshold = 1.35
 
+        # reproduction: every generation has exactly num_agents agents
+        self.elitism = 1
+        self.tournament_size = 3
+        self.crossover_rate = 0.75
+
     def next_generation(self):
         """ take the required steps for advancing a generation """
-        self.speciate_agents()
-        self.select_fit_agents()
-        #self.crossover()
-        self.agents = self.agents + copy.deepcopy(self.agents) # TODO cross over instead of this garbage
-        if len(self.agents) < 80:
-            new_agents = copy.deepcopy(self.agents)
-            innovation_number = -1
-            for agent in new_agents:
-                if random.random() > self.node_mutation_rate:
-                    innovation_number = agent.add_node(self.connections, self.current_innovation)
-                if random.random() > self.connection_mutation_rate:
-                    innovation_number = agent.add_connection(self.connections, self.current_innovation)
-
-                # update innovation number
-                if innovation_number > self.current_innovation:
-                    self.current_innovation = innovation_number
-            self.agents += new_agents
-
-        self.mutate()
-
-    def create_agents(self, num_inputs: int, num_outputs: int):
+        self.population_phenotype = None
+        self.innovations.new_generation()
+        telemetry = self.telemetry
+        with telemetry.phase("speciation"):
+            self.speciate_agents()
+        with telemetry.phase("selection"):
+            self.select_fit_agents()
+        with telemetry.phase("reproduction"):
+            offspring = self.reproduce()
+        with telemetry.phase("mutation"):
+            self.mutate(offspring)
+
+    def close(self):
+        """ shut down the speciator's process pool """
+        self.speciator.close()
+
+    def get_actions(self, states: np.ndarray) -> np.ndarray:
+        """ get an action from every agent at once, given one state row per agent """
+        if self.population_phenotype is None:
+            phenotypes = [agent.compile() if agent.phenotype is None else agent.phenotype for agent in self.agents]
+            self.population_phenotype = PopulationPhenotype(phenotypes)
+
+        # select index of output node with largest value for each agent
+        return np.argmax(self.population_phenotype.forward(states), axis=1)
+
+    def create_agents(self, num_inputs: int, num_outputs: int, activation: str):
         """ create original agents """
         self.agents: list[Agents] = []
 
         for i in range(self.num_agents):
-            agent = Agent(num_inputs, num_outputs)
+            agent = Agent(num_inputs, num_outputs, activation)
 
             # give agent a random mutation
             if random.random() > 0.5:
-                innovation_num = agent.add_connection(self.connections, self.current_innovation)
+                agent.add_connection(self.innovations)
             else:
-                innovation_num = agent.add_node(self.connections, self.current_innovation)
-
-            # update innovation number
-            if innovation_num > self.current_innovation:
-                self.current_innovation = innovation_num
+                agent.add_node(self.innovations)
 
             self.agents.append(agent)
 
     def speciate_agents(self):
-        """ seperate agents into species """
-        self.species: list[list[Agents]] = []
-
-        for agent in self.agents:
-            new_specie = True
-            # check if agent is part of an existing specie
-            for specie in self.species:
-                representative_specie = specie[0]
-                speciation_difference = agent.speciation_difference(representative_specie, self.speciation_threshold, self.speciation_weights)
-                #print("sp diff:",speciation_difference, self.speciation_threshold) # TODO remove only for debuggin
-                if speciation_difference < self.speciation_threshold:
-                    specie.append(agent)
-                    new_specie = False
-                    break
-
-            # if agent does not belong to any specie, create new
-            if new_specie:
-                self.species.append([ agent ])
+        """ seperate agents into species, matching them against last generation's representatives first """
+        self.species, self.representatives = self.speciator.speciate(self.agents, self.representatives, self.speciation_weights, self.speciation_threshold)
 
     def select_fit_agents(self):
-        """ select the fittest agents from each species """
+        """ keep the fittest agents of each species, killing off kill_off_rate of them but never the last one """
         fit_species: list[list[Agents]] = []
         fit_agents = []
         for specie in self.species:
-            specie.sort(key=lambda agent: agent.fitness)
-            fittest_agents = specie[:len(specie)//2]
+            specie.sort(key=lambda agent: agent.fitness, reverse=True)
+            fittest_agents = specie[:max(round(len(specie) * (1 - self.kill_off_rate)), 1)]
             fit_species.append(fittest_agents)
             fit_agents += fittest_agents
         self.species = fit_species
         self.agents = fit_agents
 
-    def mutate(self):
-        """ mutate agents based on mutation rates """
-        innovation_number = -1
-        for agent in self.agents:
+    def allocate_offspring(self) -> list[int]:
+        """
+        number of agents each species gets next generation, adding up to num_agents
+        fitness is shared within a species, so a species' share is the mean fitness of its survivors,
+        shifted so the least fit agent counts as 0, species that get no agents die out
+        """
+        lowest_fitness = min(agent.fitness for agent in self.agents)
+        shares = [sum(agent.fitness - lowest_fitness for agent in specie) / len(specie) for specie in self.species]
+        total_share = sum(shares)
+        if total_share <= 0:
+            shares = [1] * len(self.species)
+            total_share = len(self.species)
+
+        # whole agents by largest remainder
+        exact = [share * self.num_agents / total_share for share in shares]
+        counts = [int(count) for count in exact]
+        by_remainder = sorted(range(len(exact)), key=lambda i: exact[i] - counts[i], reverse=True)
+        for i in by_remainder[:self.num_agents - sum(counts)]:
+            counts[i] += 1
+        return counts
+
+    def tournament(self, specie: list[Agent]) -> Agent:
+        """ the fittest of tournament_size agents drawn from a species """
+        return max((random.choice(specie) for _ in range(self.tournament_size)), key=lambda agent: agent.fitness)
+
+    def reproduce(self) -> list[Agent]:
+        """
+        replace the population with the next generation of exactly num_agents agents
+        the fittest agent of the population always carries over unchanged, and each species' best elitism agents
+        do too if it gets more agents than that, the rest are children of tournament winners,
+        from crossover with crossover_rate or as clones otherwise
+        returns the children, which still need to be mutated
+        """
+        self.population_phenotype = None
+        counts = self.allocate_offspring()
+
+        # species are sorted by fitness, so the champion leads its species, which gets at least its slot
+        champion_specie = max(range(len(self.species)), key=lambda i: self.species[i][0].fitness)
+        if counts[champion_specie] == 0:
+            counts[counts.index(max(counts))] -= 1
+            counts[champion_specie] = 1
+
+        next_species: list[list[Agent]] = []
+        offspring: list[Agent] = []
+        for i, (specie, count) in enumerate(zip(self.species, counts)):
+            if count == 0:
+                continue
+            elites = self.elitism if count > self.elitism else 0
+            if i == champion_specie:
+                elites = max(elites, 1)
+            next_specie = [agent.clone() for agent in specie[:elites]]
+            while len(next_specie) < count:
+                parent = self.tournament(specie)
+                if len(specie) > 1 and random.random() < self.crossover_rate:
+                    child = parent.crossover(self.tournament(specie))
+                else:
+                    child = parent.clone()
+                next_specie.append(child)
+                offspring.append(child)
+            next_species.append(next_specie)
+
+        self.species = next_species
+        self.agents = [agent for specie in next_species for agent in specie]
+        return offspring
+
+    def mutate(self, agents: list[Agent] = None):
+        """ mutate agents based on mutation rates, every agent by default """
+        self.population_phenotype = None
+        for agent in self.agents if agents is None else agents:
             if random.random() > self.node_mutation_rate:
-                innovation_number = agent.add_node(self.connections, self.current_innovation)
+                agent.add_node(self.innovations)
             if random.random() > self.connection_mutation_rate:
-                innovation_number = agent.add_connection(self.connections, self.current_innovation)
-
-            # update innovation number
-            if innovation_number > self.current_innovation:
-                self.current_innovation = innovation_number
-
-    def crossover(self):
-        """ cross over agents from same species """
-        for specie in self.species:
-            new_agents = []
-            for i in range(1, len(specie)):
-                agent = specie[i]
-                prev_agent = specie[i-1]
-                new_agent = prev_agent.crossover(agent)
-                new_agents.append(new_agent)
-            specie += new_agents
-
-
-
-
+                agent.add_connection(self.innovations)
@@ -0,0 +1,322 @@
+import numpy as np
+
+from Activations import get_activation
+
+# fancy indexing costs about as much as copying a few hundred values, so smaller states are always copied whole
+sparse_input_threshold = 256
+
+class Phenotype:
+    """
+    compiled, flat evaluation plan for an agent's network
+    built once per genome and reused for every game step
+    """
+    def __init__(self, num_inputs: int, num_outputs: int, out_nodes: np.ndarray, in_nodes: np.ndarray, weights: np.ndarray,
+                 activation: str = "sigmoid", lookup: bool = False, ticks: int = None):
+        """
+        compile a network from its enabled connections
+        signal flows from a connection's out node into its in node, as in Connection
+        activation names the function applied to every hidden and output node, lookup uses its lookup table if it has one
+        ticks makes the network recurrent: node values persist between calls to forward, and each call runs
+        that many synchronous updates of every node over all connections, cycles included
+        without ticks, cycles are broken and each call runs the feed forward layers from scratch
+        """
+        self.num_inputs = num_inputs
+        self.num_outputs = num_outputs
+        self.activation = activation
+        self.activate = get_activation(activation, lookup)
+        self.ticks = ticks
+
+        out_nodes = np.asarray(out_nodes, dtype=np.int64)
+        in_nodes = np.asarray(in_nodes, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        # input values are clamped to the game state, so drop connections into inputs
+        keep = in_nodes > num_inputs
+        out_nodes, in_nodes, weights = out_nodes[keep], in_nodes[keep], weights[keep]
+
+        # node id's start at 1: inputs, then outputs, then hidden nodes
+        io_ids = np.arange(1, num_inputs + num_outputs + 1)
+        node_ids = np.union1d(io_ids, np.concatenate((out_nodes, in_nodes)))
+        sources = np.searchsorted(node_ids, out_nodes)
+        targets = np.searchsorted(node_ids, in_nodes)
+
+        # feed forward networks drop the back edges closing their cycles before anything is pruned, so pruning only removes
+        # structure that cannot change the outputs of the network without them, then nodes without a path from an input
+        # are folded into constant biases
+        bias = np.zeros(len(node_ids))
+        if ticks is None:
+            _, recurrent = self.topological_layers(len(node_ids), sources, targets)
+            sources, targets, weights = sources[~recurrent], targets[~recurrent], weights[~recurrent]
+            constant, constant_values = self.constant_nodes(len(node_ids), sources, targets, weights)
+            folded = constant[sources]
+            np.add.at(bias, targets[folded], weights[folded] * constant_values[sources[folded]])
+            sources, targets, weights = sources[~folded], targets[~folded], weights[~folded]
+
+        # only nodes with a path to an output change the result, inputs stay so states keep their layout
+        live = self.reaches_outputs(len(node_ids), sources, targets)
+        kept = live[sources] & live[targets]
+        sources, targets, weights = sources[kept], targets[kept], weights[kept]
+        index = np.cumsum(live) - 1
+        node_ids, bias = node_ids[live], bias[live]
+        sources, targets = index[sources], index[targets]
+
+        # assign every non input node to a layer
+        layers, recurrent = self.topological_layers(len(node_ids), sources, targets)
+
+        # evaluation order: inputs first, then each layer in turn
+        order = np.concatenate([np.arange(num_inputs)] + layers)
+        position = np.empty(len(node_ids), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        sources = position[sources]
+        targets = position[targets]
+
+        self.node_ids = node_ids[order]
+        self.output_positions = position[num_inputs:num_inputs + num_outputs]
+        bias = bias[order]
+
+        # every connection, for synchronous recurrent updates
+        self.edges = (sources, targets, weights)
+
+        # contiguous edge arrays and biases for each layer, dropping edges that close a cycle
+        feed_forward = ~recurrent
+        sources, targets, weights = sources[feed_forward], targets[feed_forward], weights[feed_forward]
+        self.layers: list[tuple[int, int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+        start = num_inputs
+        for layer in layers:
+            end = start + len(layer)
+            in_layer = (targets >= start) & (targets < end)
+            self.layers.append((start, end, sources[in_layer], targets[in_layer] - start, weights[in_layer], bias[start:end]))
+            start = end
+
+        # only inputs with a connection are copied from large states
+        connected = np.unique(sources[sources < num_inputs])
+        self.inputs = connected if num_inputs - len(connected) > sparse_input_threshold else slice(0, num_inputs)
+
+        self.values = np.zeros(len(self.node_ids))
+
+    def constant_nodes(self, num_nodes: int, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        find the nodes of an acyclic network that no input reaches, and the values they always take
+        returns a mask of those nodes and every node's value when all inputs are 0
+        """
+        reached = np.zeros(num_nodes, dtype=bool)
+        reached[:self.num_inputs] = True
+        values = np.zeros(num_nodes)
+        layers, _ = self.topological_layers(num_nodes, sources, targets)
+        for layer in layers:
+            in_layer = np.isin(targets, layer)
+            layer_sources, layer_targets = sources[in_layer], targets[in_layer]
+            reached[layer_targets[reached[layer_sources]]] = True
+            total_value = np.bincount(layer_targets, weights=weights[in_layer] * values[layer_sources], minlength=num_nodes)
+            values[layer] = self.activate(total_value[layer])
+        return ~reached, values
+
+    def reaches_outputs(self, num_nodes: int, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        """ mask of the nodes with a path to an output, inputs and outputs included """
+        # walk edges backwards from the outputs until no new node is reached
+        reached = np.zeros(num_nodes, dtype=bool)
+        reached[self.num_inputs:self.num_inputs + self.num_outputs] = True
+        while True:
+            new = np.zeros(num_nodes, dtype=bool)
+            new[sources[reached[targets]]] = True
+            new &= ~reached
+            if not new.any():
+                break
+            reached |= new
+        reached[:self.num_inputs] = True
+        return reached
+
+    def back_edges(self, num_nodes: int, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        """
+        mask of the edges that close a cycle, found by a depth first search from the inputs, then from any node not yet seen
+        an edge is flagged when it leads back to a node still on the search path, so edges on no cycle are never flagged
+        """
+        out_edges: list[list[int]] = [[] for _ in range(num_nodes)]
+        for edge, source in enumerate(sources.tolist()):
+            out_edges[source].append(edge)
+        targets = targets.tolist()
+
+        recurrent = np.zeros(len(sources), dtype=bool)
+        # 0: not seen, 1: on the search path, 2: done
+        state = [0] * num_nodes
+        for root in range(num_nodes):
+            if state[root]:
+                continue
+            state[root] = 1
+            path = [(root, iter(out_edges[root]))]
+            while path:
+                node, edges = path[-1]
+                for edge in edges:
+                    target = targets[edge]
+                    if state[target] == 1:
+                        recurrent[edge] = True
+                    elif state[target] == 0:
+                        state[target] = 1
+                        path.append((target, iter(out_edges[target])))
+                        break
+                else:
+                    state[node] = 2
+                    path.pop()
+        return recurrent
+
+    def topological_layers(self, num_nodes: int, sources: np.ndarray, targets: np.ndarray) -> (list[np.ndarray], np.ndarray):
+        """
+        split non input nodes into layers that only depend on earlier layers
+        cycles are broken at their back edges, which are flagged as recurrent
+        """
+        num_inputs = self.num_inputs
+        recurrent = self.back_edges(num_nodes, sources, targets)
+
+        # edges leaving input nodes are satisfied before the first layer
+        internal = (sources >= num_inputs) & ~recurrent
+        in_degree = np.bincount(targets[internal], minlength=num_nodes)
+        out_edges: list[list[int]] = [[] for _ in range(num_nodes)]
+        for edge in np.flatnonzero(internal):
+            out_edges[sources[edge]].append(edge)
+
+        frontier = [node for node in range(num_inputs, num_nodes) if in_degree[node] == 0]
+        layers = []
+        while frontier:
+            frontier.sort()
+            layers.append(np.array(frontier, dtype=np.int64))
+
+            # release nodes whose inputs are now all evaluated
+            next_frontier = []
+            for node in frontier:
+                for edge in out_edges[node]:
+                    target = targets[edge]
+                    in_degree[target] -= 1
+                    if in_degree[target] == 0:
+                        next_frontier.append(target)
+            frontier = next_frontier
+
+        return layers, recurrent
+
+    def reset(self) -> None:
+        """ clear the node values a recurrent network carries between steps, call it at the start of every game """
+        self.values[:] = 0
+
+    def update_inputs(self, indices: np.ndarray, inputs: np.ndarray) -> None:
+        """ change some of the input values, for states that only differ from the last one in a few places """
+        self.values[indices] = inputs
+
+    def forward(self, state: np.ndarray = None) -> np.ndarray:
+        """ run the network on a game state and return the output node values, None keeps the current input values """
+        values = self.values
+        if state is not None:
+            values[self.inputs] = state[self.inputs]
+        if self.ticks is not None:
+            # every node reads the previous tick's values, so the result does not depend on evaluation order
+            sources, targets, weights = self.edges
+            for _ in range(self.ticks):
+                total_value = np.bincount(targets, weights=weights * values[sources], minlength=len(values))
+                values[self.num_inputs:] = self.activate(total_value[self.num_inputs:])
+            return values[self.output_positions]
+
+        for start, end, sources, targets, weights, bias in self.layers:
+            total_value = np.bincount(targets, weights=weights * values[sources], minlength=end - start) + bias
+            values[start:end] = self.activate(total_value)
+        return values[self.output_positions]
+
+class PopulationPhenotype:
+    """
+    every agent's phenotype stacked into one block diagonal network
+    nodes of the same depth from all agents are evaluated together, so a whole population costs a few kernels per layer
+    and one activation call per distinct activation function in it
+    """
+    def __init__(self, phenotypes: list[Phenotype]):
+        """ stack compiled phenotypes that share the same number of inputs and outputs, and the same ticks """
+        self.num_agents = len(phenotypes)
+        self.num_inputs = phenotypes[0].num_inputs
+        self.num_outputs = phenotypes[0].num_outputs
+        self.ticks = phenotypes[0].ticks
+        num_layers = max(len(phenotype.layers) for phenotype in phenotypes)
+
+        # global positions: every agent's inputs first, then each depth's nodes from all agents
+        positions = [np.empty(len(phenotype.node_ids), dtype=np.int64) for phenotype in phenotypes]
+        for agent, phenotype in enumerate(phenotypes):
+            positions[agent][:self.num_inputs] = np.arange(agent * self.num_inputs, (agent + 1) * self.num_inputs)
+        start = self.num_agents * self.num_inputs
+        layer_bounds = []
+        for depth in range(num_layers):
+            layer_start = start
+            for agent, phenotype in enumerate(phenotypes):
+                if depth < len(phenotype.layers):
+                    local_start, local_end = phenotype.layers[depth][:2]
+                    positions[agent][local_start:local_end] = np.arange(start, start + local_end - local_start)
+                    start += local_end - local_start
+            layer_bounds.append((layer_start, start))
+
+        # edges of each depth, translated to global positions
+        # along with the nodes of each depth grouped by activation, None when the whole depth shares one
+        self.layers: list[tuple[int, int, np.ndarray, np.ndarray, np.ndarray, np.ndarray, list]] = []
+        for depth, (layer_start, layer_end) in enumerate(layer_bounds):
+            sources, targets, weights = [], [], []
+            bias = np.zeros(layer_end - layer_start)
+            groups: dict = {}
+            for agent, phenotype in enumerate(phenotypes):
+                if depth < len(phenotype.layers):
+                    local_start, local_end, local_sources, local_targets, local_weights, local_bias = phenotype.layers[depth]
+                    sources.append(positions[agent][local_sources])
+                    targets.append(positions[agent][local_targets + local_start] - layer_start)
+                    weights.append(local_weights)
+                    bias[positions[agent][local_start:local_end] - layer_start] = local_bias
+                    groups.setdefault(phenotype.activate, []).append(positions[agent][local_start:local_end] - layer_start)
+            if len(groups) == 1:
+                activations = [(activate, None) for activate in groups]
+            else:
+                activations = [(activate, np.concatenate(nodes)) for activate, nodes in groups.items()]
+            self.layers.append((layer_start, layer_end, np.concatenate(sources), np.concatenate(targets), np.concatenate(weights), bias, activations))
+
+        self.output_positions = np.stack([positions[agent][phenotype.output_positions] for agent, phenotype in enumerate(phenotypes)])
+        self.values = np.zeros(start)
+
+        # every agent's connected inputs, as positions in the flattened states
+        self.inputs = np.concatenate([positions[agent][np.arange(self.num_inputs)[phenotype.inputs]] for agent, phenotype in enumerate(phenotypes)])
+        if len(self.inputs) > self.num_agents * self.num_inputs - sparse_input_threshold:
+            self.inputs = slice(0, self.num_agents * self.num_inputs)
+
+        # recurrent networks update all their nodes at once, over every connection
+        if self.ticks is not None:
+            first_node = self.num_agents * self.num_inputs
+            self.edges = tuple(np.concatenate(arrays) for arrays in zip(*(
+                (positions[agent][phenotype.edges[0]], positions[agent][phenotype.edges[1]], phenotype.edges[2])
+                for agent, phenotype in enumerate(phenotypes))))
+            groups: dict = {}
+            for agent, phenotype in enumerate(phenotypes):
+                groups.setdefault(phenotype.activate, []).append(positions[agent][self.num_inputs:] - first_node)
+            if len(groups) == 1:
+                self.activations = [(activate, None) for activate in groups]
+            else:
+                self.activations = [(activate, np.concatenate(nodes)) for activate, nodes in groups.items()]
+
+    def reset(self) -> None:
+        """ clear the node values recurrent networks carry between steps """
+        self.values[:] = 0
+
+    def forward(self, states: np.ndarray) -> np.ndarray:
+        """ run every network on its own state row and return a (num_agents, num_outputs) array of output values """
+        values = self.values
+        values[self.inputs] = np.reshape(states, -1)[self.inputs]
+        if self.ticks is not None:
+            first_node = self.num_agents * self.num_inputs
+            sources, targets, weights = self.edges
+            for _ in range(self.ticks):
+                total_value = np.bincount(targets, weights=weights * values[sources], minlength=len(values))[first_node:]
+                node_values = values[first_node:]
+                for activate, nodes in self.activations:
+                    if nodes is None:
+                        node_values[:] = activate(total_value)
+                    else:
+                        node_values[nodes] = activate(total_value[nodes])
+            return values[self.output_positions]
+
+        for start, end, sources, targets, weights, bias, activations in self.layers:
+            total_value = np.bincount(targets, weights=weights * values[sources], minlength=end - start) + bias
+            layer_values = values[start:end]
+            for activate, nodes in activations:
+                if nodes is None:
+                    layer_values[:] = activate(total_value)
+                else:
+                    layer_values[nodes] = activate(total_value[nodes])
+        return values[self.output_positions]
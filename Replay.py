@@ -0,0 +1,134 @@
+import os
+import numpy as np
+
+from Game import EndReason, Game
+from Phenotype import Phenotype
+
+class Episode:
+    """
+    a recorded game: everything needed to play it again without the network
+    the board is fully determined by the game's settings, its seed and the actions taken
+    food_steps are the steps on which food was eaten, checked on replay along with the end reason
+    """
+    def __init__(self, dimensions: (int, int), seed: int, actions: np.ndarray, food_steps: np.ndarray, end_reason: EndReason,
+                 max_steps: int = None, starvation_limit: int = None, detect_loops: bool = False):
+        self.dimensions = dimensions
+        self.seed = seed
+        self.actions = np.asarray(actions, dtype=np.uint8)
+        self.food_steps = np.asarray(food_steps, dtype=np.uint32)
+        self.end_reason = end_reason
+        self.max_steps = max_steps
+        self.starvation_limit = starvation_limit
+        self.detect_loops = detect_loops
+
+    @property
+    def points(self) -> int:
+        return len(self.food_steps)
+
+    def new_game(self) -> Game:
+        """ a game with the episode's settings, reset to its first state """
+        game = Game(self.dimensions, max_steps=self.max_steps, starvation_limit=self.starvation_limit, detect_loops=self.detect_loops)
+        game.reset(self.seed)
+        return game
+
+def record_game(env: Game, phenotype: Phenotype, seed: int) -> Episode:
+    """ play one seeded game with a compiled network, as play_game does, and record it """
+    env.reset(seed)
+    phenotype.reset()
+    actions = []
+    food_steps = []
+    while not env.done:
+        action = int(np.argmax(phenotype.forward(env.observe())))
+        points = env.points
+        env.step(action)
+        actions.append(action)
+        if env.points > points:
+            food_steps.append(env.steps)
+    return Episode(env.dimensions, seed, actions, food_steps, env.end_reason, env.max_steps, env.starvation_limit, env.detect_loops)
+
+def replay(episode: Episode):
+    """
+    play an episode's actions again, yielding the game after every step, starting from its first state
+    raises ValueError if the replay does not eat on the recorded steps or ends differently
+    """
+    game = episode.new_game()
+    yield game
+    food_steps = iter(episode.food_steps.tolist())
+    next_food = next(food_steps, None)
+    for action in episode.actions.tolist():
+        if game.done:
+            raise ValueError(f"episode ended after {game.steps} of {len(episode.actions)} steps")
+        points = game.points
+        game.step(action)
+        if game.points > points:
+            if game.steps != next_food:
+                raise ValueError(f"episode diverged: food eaten on step {game.steps}, recorded on step {next_food}")
+            next_food = next(food_steps, None)
+        yield game
+
+    if next_food is not None or game.end_reason != episode.end_reason:
+        raise ValueError(f"episode diverged: ended with {game.points} points ({game.end_reason.name}), "
+                         f"recorded {episode.points} ({episode.end_reason.name})")
+
+def replay_frames(episode: Episode, scale: int = 30):
+    """ images of every state of an episode, for rendering offline """
+    for game in replay(episode):
+        yield game.frame(scale)
+
+def pack_actions(actions: np.ndarray) -> np.ndarray:
+    """ pack actions 0 to 3 into 2 bits each, four to a byte """
+    padded = np.zeros(-(-len(actions) // 4) * 4, dtype=np.uint8)
+    padded[:len(actions)] = actions
+    padded = padded.reshape(-1, 4)
+    return padded[:, 0] | padded[:, 1] << 2 | padded[:, 2] << 4 | padded[:, 3] << 6
+
+def unpack_actions(packed: np.ndarray, num_actions: int) -> np.ndarray:
+    """ undo pack_actions """
+    actions = (packed[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+    return actions.reshape(-1)[:num_actions]
+
+def save_episodes(path: str, episodes: list[Episode]) -> None:
+    """
+    save episodes as packed arrays in one .npz file, about a quarter byte per step and four bytes per food
+    written next to path first and then moved over it, as in save_checkpoint
+    """
+    none = -1
+    arrays = {
+        # one row per episode: width, height, seed, steps, foods, end reason, max steps, starvation limit, detect loops
+        "episodes": np.array([
+            (*episode.dimensions, episode.seed, len(episode.actions), len(episode.food_steps), episode.end_reason.value,
+             none if episode.max_steps is None else episode.max_steps,
+             none if episode.starvation_limit is None else episode.starvation_limit,
+             episode.detect_loops) for episode in episodes], dtype=np.int64).reshape(-1, 9),
+        "actions": np.concatenate([pack_actions(episode.actions) for episode in episodes] or [np.empty(0, dtype=np.uint8)]),
+        "food_steps": np.concatenate([episode.food_steps for episode in episodes] or [np.empty(0, dtype=np.uint32)]),
+    }
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as episodes_file:
+        np.savez_compressed(episodes_file, **arrays)
+    os.replace(temp_path, path)
+
+def load_episodes(path: str) -> list[Episode]:
+    """ load episodes saved by save_episodes """
+    with np.load(path) as saved:
+        rows = saved["episodes"].tolist()
+        actions = saved["actions"]
+        food_steps = saved["food_steps"]
+
+    episodes = []
+    action_offset = food_offset = 0
+    for width, height, seed, steps, foods, end_reason, max_steps, starvation_limit, detect_loops in rows:
+        packed_steps = -(-steps // 4)
+        episodes.append(Episode(
+            (width, height), seed,
+            unpack_actions(actions[action_offset:action_offset + packed_steps], steps),
+            food_steps[food_offset:food_offset + foods],
+            EndReason(end_reason),
+            None if max_steps < 0 else max_steps,
+            None if starvation_limit < 0 else starvation_limit,
+            bool(detect_loops),
+        ))
+        action_offset += packed_steps
+        food_offset += foods
+    return episodes
@@ -0,0 +1,152 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+def pack_genes(agents: list['Agent']) -> (np.ndarray, np.ndarray, np.ndarray):
+    """ stack agents' innovation numbers and weights into rows padded with -1, along with each agent's gene count """
+    counts = np.array([len(agent.genes) for agent in agents], dtype=np.int64)
+    innovations = np.full((len(agents), max(counts.max(initial=0), 1)), -1, dtype=np.int64)
+    weights = np.zeros(innovations.shape)
+    for i, agent in enumerate(agents):
+        innovations[i, :counts[i]] = agent.genes["innovation"]
+        weights[i, :counts[i]] = agent.genes["weight"]
+    return innovations, weights, counts
+
+def speciation_distances(agent_genes: tuple, representative_genes: tuple, speciation_weights: list[float], speciation_threshold: float,
+                         max_elements: int = 1 << 22) -> np.ndarray:
+    """
+    speciation difference between every agent and every representative, as in Agent.speciation_difference
+    pairs whose gene counts or innovation ranges already put them past the threshold are left at infinity
+    """
+    agent_innovations, agent_weights, agent_counts = agent_genes
+    representative_innovations, representative_weights, representative_counts = representative_genes
+    c1, c2, c3 = speciation_weights
+    distances = np.full((len(agent_counts), len(representative_counts)), np.inf)
+
+    # newest and oldest innovation of every genome, padding is -1 so it never counts as newer
+    agent_newest = agent_innovations.max(axis=1)
+    agent_oldest = np.where(agent_innovations >= 0, agent_innovations, np.iinfo(np.int64).max).min(axis=1)
+    representative_newest = representative_innovations.max(axis=1)
+    representative_oldest = np.where(representative_innovations >= 0, representative_innovations, np.iinfo(np.int64).max).min(axis=1)
+
+    # at least this many genes go unmatched: the gene count difference, or every gene if the innovation ranges do not overlap
+    overlap = (agent_oldest[:, None] <= representative_newest[None, :]) & (representative_oldest[None, :] <= agent_newest[:, None])
+    count_difference = np.abs(agent_counts[:, None] - representative_counts[None, :])
+    unmatched = np.where(overlap, count_difference, agent_counts[:, None] + representative_counts[None, :])
+    most_genes = np.maximum(np.maximum(agent_counts[:, None], representative_counts[None, :]), 1)
+    lower_bound = min(c1, c2) * unmatched / most_genes
+    agents, representatives = np.nonzero(lower_bound < speciation_threshold)
+    if len(agents) == 0:
+        return distances
+
+    # every pair's representative genes as one sorted array of keys: pair * key_range + innovation, padding sorts last
+    key_range = max(agent_newest.max(), representative_newest.max()) + 2
+    chunk_size = max(max_elements // (agent_innovations.shape[1] + representative_innovations.shape[1]), 1)
+    for start in range(0, len(agents), chunk_size):
+        a = agents[start:start + chunk_size]
+        r = representatives[start:start + chunk_size]
+        pairs = np.arange(len(a))[:, None] * key_range
+        representative_keys = (pairs + np.where(representative_innovations[r] >= 0, representative_innovations[r], key_range - 1)).ravel()
+
+        # joint genes share an innovation number, found by looking the agent's keys up in the representative's
+        agent_valid = agent_innovations[a] >= 0
+        agent_keys = (pairs + agent_innovations[a]).ravel()
+        position = np.minimum(np.searchsorted(representative_keys, agent_keys), len(representative_keys) - 1)
+        joint = (representative_keys[position] == agent_keys) & agent_valid.ravel()
+        weight_diff = np.where(joint, np.abs(agent_weights[a].ravel() - representative_weights[r].ravel()[position]), 0)
+        joint_genes = joint.reshape(len(a), -1).sum(axis=1)
+        joint_genes_weight_diff = weight_diff.reshape(len(a), -1).sum(axis=1)
+
+        # genes newer than the other genome's newest innovation are excess, the remaining unmatched genes are disjoint
+        excess_genes = (agent_innovations[a] > representative_newest[r][:, None]).sum(axis=1)
+        excess_genes += (representative_innovations[r] > agent_newest[a][:, None]).sum(axis=1)
+        disjoint_genes = agent_counts[a] + representative_counts[r] - 2 * joint_genes - excess_genes
+
+        joint_genes_avg_weight_diff = np.where(joint_genes > 0, joint_genes_weight_diff / np.maximum(joint_genes, 1), 0)
+        distances[a, r] = (c1 * excess_genes + c2 * disjoint_genes) / most_genes[a, r] + c3 * joint_genes_avg_weight_diff
+
+    return distances
+
+def select_genes(genes: tuple, rows: np.ndarray) -> tuple:
+    """ take some rows of packed genes """
+    return tuple(array[rows] for array in genes)
+
+def first_within(agent_genes: tuple, representative_genes: tuple, speciation_weights: list[float], speciation_threshold: float,
+                 block_size: int = 16) -> np.ndarray:
+    """
+    index of the first representative within the threshold of each agent, -1 if none
+    representatives are tried a block at a time in order, and matched agents skip the later blocks
+    """
+    num_agents = len(agent_genes[2])
+    assignments = np.full(num_agents, -1, dtype=np.int64)
+    for start in range(0, len(representative_genes[2]), block_size):
+        remaining = np.flatnonzero(assignments < 0)
+        if len(remaining) == 0:
+            break
+        block = np.arange(start, min(start + block_size, len(representative_genes[2])))
+        within = speciation_distances(select_genes(agent_genes, remaining), select_genes(representative_genes, block), speciation_weights, speciation_threshold) < speciation_threshold
+        matched = within.any(axis=1)
+        assignments[remaining[matched]] = start + np.argmax(within[matched], axis=1)
+    return assignments
+
+class Speciator:
+    """
+    sorts agents into species against the previous generation's representatives
+    agent versus representative distances are computed in vectorized batches, optionally over a process pool
+    """
+    def __init__(self, batch_size: int = 256, workers: int = 1):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.pool: ProcessPoolExecutor = None
+
+    def speciate(self, agents: list['Agent'], representatives: list['Agent'], speciation_weights: list[float], speciation_threshold: float) -> (list[list['Agent']], list['Agent']):
+        """
+        place each agent in the first species whose representative is within the threshold, or start a new species
+        returns the non empty species and a frozen representative for each of them
+        """
+        species: list[list['Agent']] = [[] for _ in representatives]
+        assignments = np.full(len(agents), -1, dtype=np.int64)
+
+        # match every agent against the existing representatives in batches
+        if representatives and agents:
+            representative_genes = pack_genes(representatives)
+            batches = [agents[i:i + self.batch_size] for i in range(0, len(agents), self.batch_size)]
+            jobs = [(pack_genes(batch), representative_genes, speciation_weights, speciation_threshold) for batch in batches]
+            if self.workers > 1:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(self.workers)
+                results = self.pool.map(first_within, *zip(*jobs))
+            else:
+                results = (first_within(*job) for job in jobs)
+            assignments = np.concatenate(list(results))
+
+        for i in np.flatnonzero(assignments >= 0):
+            species[assignments[i]].append(agents[i])
+
+        # unmatched agents start new species in order, the agents after them join the first new species they are close to
+        # candidates are checked a block at a time: the next unassigned agents, in order, against every unassigned agent
+        unmatched = [agents[i] for i in np.flatnonzero(assignments < 0)]
+        unmatched_genes = pack_genes(unmatched)
+        unassigned = np.ones(len(unmatched), dtype=bool)
+        while unassigned.any():
+            remaining = np.flatnonzero(unassigned)
+            candidates = remaining[:self.batch_size]
+            within = speciation_distances(select_genes(unmatched_genes, remaining), select_genes(unmatched_genes, candidates), speciation_weights, speciation_threshold) < speciation_threshold
+
+            for column, candidate in enumerate(candidates):
+                # candidate already joined an earlier new species
+                if not unassigned[candidate]:
+                    continue
+                members = remaining[within[:, column] & unassigned[remaining] & (remaining > candidate)]
+                unassigned[candidate] = False
+                unassigned[members] = False
+                species.append([unmatched[candidate]] + [unmatched[i] for i in members])
+
+        # the first member of each species represents it next generation, frozen against later mutation
+        species = [specie for specie in species if specie]
+        return species, [specie[0].clone() for specie in species]
+
+    def close(self) -> None:
+        """ shut down the process pool """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -0,0 +1,130 @@
+import csv
+import json
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+# shared do nothing context for disabled telemetry, so phases cost a single attribute check
+disabled_phase = nullcontext()
+
+class Phase:
+    """ context manager adding the wall time of a block to a phase of the current generation """
+    def __init__(self, telemetry: 'Telemetry', name: str):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self) -> 'Phase':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = self.telemetry.phase_seconds
+        seconds[self.name] = seconds.get(self.name, 0.0) + time.perf_counter() - self.start
+
+class Telemetry:
+    """
+    per generation timings and statistics of a NEAT run
+    phases are timed with `with telemetry.phase(name):`, and at the end of each generation one flat record
+    is handed to every hook, such as JSONLSink or CSVSink
+    disabled telemetry times nothing and builds no records
+    """
+    def __init__(self, enabled: bool = True, hooks: list = None):
+        self.enabled = enabled
+        self.hooks = [] if hooks is None else list(hooks)
+        self.phase_seconds: dict[str, float] = {}
+        self.values: dict = {}
+
+    def add_hook(self, hook) -> None:
+        """ call hook with every generation's record """
+        self.hooks.append(hook)
+
+    def phase(self, name: str):
+        """ time a block as part of the named phase, phases entered more than once in a generation add up """
+        if not self.enabled:
+            return disabled_phase
+        return Phase(self, name)
+
+    def record(self, name: str, value) -> None:
+        """ add a value to the current generation's record """
+        if self.enabled:
+            self.values[name] = value
+
+    def end_generation(self, generation: int, neat: 'NEAT' = None, evaluator: 'Evaluator' = None) -> dict:
+        """
+        build the generation's record, pass it to the hooks and start a new generation
+        network sizes come from the neat population, steps and end reasons from the evaluator's last games
+        """
+        if not self.enabled:
+            return None
+
+        record = {"generation": generation, "time": time.time()}
+        for name, seconds in self.phase_seconds.items():
+            record[f"{name}_seconds"] = seconds
+        record["total_seconds"] = sum(self.phase_seconds.values())
+
+        if evaluator is not None and evaluator.steps:
+            steps = sum(evaluator.steps)
+            record["games"] = len(evaluator.steps)
+            record["steps"] = steps
+            record["mean_steps"] = steps / len(evaluator.steps)
+            if self.phase_seconds.get("evaluation"):
+                record["steps_per_second"] = steps / self.phase_seconds["evaluation"]
+            # every end reason gets a count, so CSV columns stay the same from one generation to the next
+            end_reasons = Counter(evaluator.end_reasons)
+            for end_reason in type(evaluator.end_reasons[0]):
+                record[f"end_{end_reason.name.lower()}"] = end_reasons[end_reason]
+
+        if evaluator is not None and evaluator.cache_size:
+            record["cache_hits"] = evaluator.cache_hits
+            record["cache_hit_rate"] = evaluator.cache_hits / max(evaluator.cache_lookups, 1)
+
+        if neat is not None and neat.agents:
+            record["agents"] = len(neat.agents)
+            record["species"] = len(neat.species)
+            record["mean_connections"] = sum(int(agent.genes["enabled"].sum()) for agent in neat.agents) / len(neat.agents)
+            record["mean_nodes"] = sum(len(agent.get_node_ids()) for agent in neat.agents) / len(neat.agents)
+
+        record.update(self.values)
+        self.phase_seconds = {}
+        self.values = {}
+        for hook in self.hooks:
+            hook(record)
+        return record
+
+    def close(self) -> None:
+        """ close every hook that holds a file """
+        for hook in self.hooks:
+            if hasattr(hook, "close"):
+                hook.close()
+
+class JSONLSink:
+    """ hook writing each record as one line of JSON """
+    def __init__(self, path: str):
+        self.file = open(path, "a")
+
+    def __call__(self, record: dict) -> None:
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+class CSVSink:
+    """
+    hook writing each record as a CSV row
+    columns are fixed by the first record, later fields missing from it are dropped, missing values are left empty
+    """
+    def __init__(self, path: str):
+        self.file = open(path, "a", newline="")
+        self.writer: csv.DictWriter = None
+
+    def __call__(self, record: dict) -> None:
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(record), extrasaction="ignore")
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+        self.writer.writerow(record)
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
@@ -0,0 +1,58 @@
+import multiprocessing
+import queue
+import time
+
+from Game import Game
+from NEAT import Agent
+from Phenotype import Phenotype
+
+def view_games(games: multiprocessing.Queue, dimensions: (int, int), game_options: dict, num_inputs: int, num_outputs: int,
+               network_options: dict, frame_time: float) -> None:
+    """ viewer process: play and render every genome sent to it until it gets None """
+    env = Game(dimensions, **game_options)
+    while True:
+        game = games.get()
+        # skip ahead to the newest genome if training sent more while the last game was shown
+        try:
+            while game is not None:
+                game = games.get_nowait()
+        except queue.Empty:
+            pass
+        if game is None:
+            return
+
+        genome, activation, seed = game
+        phenotype = Phenotype(num_inputs, num_outputs, *genome, activation, **network_options)
+        phenotype.reset()
+        env.reset(seed)
+        while not env.done:
+            env.render()
+            time.sleep(frame_time)
+            action = int(phenotype.forward(env.observe()).argmax())
+            env.step(action)
+
+class Viewer:
+    """
+    shows agents playing in a separate process, so rendering never blocks training
+    show only puts the agent's genome on a queue, genomes sent while the viewer is busy replace each other
+    """
+    def __init__(self, dimensions: (int, int), game_options: dict, num_inputs: int, num_outputs: int, frame_time: float = 0.1):
+        """ game_options are passed on to the viewer's Game, as in Evaluator.game_options """
+        self.games = multiprocessing.Queue(maxsize=4)
+        network_options = {"lookup": Agent.lookup_activations, "ticks": Agent.recurrent_ticks}
+        args = (self.games, dimensions, game_options, num_inputs, num_outputs, network_options, frame_time)
+        self.process = multiprocessing.Process(target=view_games, args=args, daemon=True)
+        self.process.start()
+
+    def show(self, agent: Agent, seed: int = None) -> bool:
+        """ queue a game of the agent on the given seed without waiting, returns False if the queue was full and it was dropped """
+        try:
+            self.games.put_nowait((agent.get_genome(), agent.activation, seed))
+        except queue.Full:
+            return False
+        return True
+
+    def close(self) -> None:
+        """ let the viewer finish its current game and stop """
+        self.games.put(None)
+        self.process.join()
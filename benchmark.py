@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+benchmarks for game stepping, network inference and generation turnover
+every benchmark is seeded, results are written as JSON so runs can be compared
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import time
+import numpy as np
+
+from Evaluation import Evaluator
+from Game import Game, Snake
+from NEAT import NEAT, Agent
+
+def hamiltonian_cycle(dimensions: (int, int)) -> (list[tuple[int, int]], list[int]):
+    """
+    cells of a cycle through every cell of a board with an even height, and the action leading into each cell
+    rows are swept right and left above the first column, which leads back down to the start
+    """
+    width, height = dimensions
+    cells = [(x, 0) for x in range(width)]
+    for y in range(1, height):
+        xs = range(width - 1, 0, -1) if y % 2 else range(1, width)
+        cells += [(x, y) for x in xs]
+    cells += [(0, y) for y in range(height - 1, 0, -1)]
+
+    # action to reach each cell from the previous one, as in Game.step
+    moves = {(1, 0): 0, (-1, 0): 1, (0, 1): 2, (0, -1): 3}
+    actions = [moves[(x - previous_x, y - previous_y)] for (previous_x, previous_y), (x, y) in zip(cells[-1:] + cells[:-1], cells)]
+    return cells, actions
+
+def snake_game(dimensions: (int, int), length: int, seed: int) -> Game:
+    """ a game whose snake already has the given length, lying along the hamiltonian cycle with its head at the cycle's end """
+    cells, _ = hamiltonian_cycle(dimensions)
+    game = Game(dimensions, seed=seed)
+    game.board[:] = 0
+    game.reset_free_cells()
+
+    head = len(cells) - 1
+    game.snake = Snake(*cells[head], len(cells))
+    for k in range(length):
+        x, y = cells[head - k]
+        game.snake.cells[k] = (x, y)
+        game.board[y][x] = -1
+        game.occupy_cell(x, y)
+    game.snake.length = length
+    game.place_food()
+    return game
+
+def time_calls(function, min_time: float) -> (int, float):
+    """ call function until min_time has passed, returns the number of calls and the total time """
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return calls, elapsed
+
+def bench_game_step(board_sizes: list[int], length_fractions: list[float], min_time: float, seed: int) -> list[dict]:
+    """ Game.step steps per second against board size and snake length, the snake follows a cycle so it never dies """
+    results = []
+    for size in board_sizes:
+        dimensions = (size, size)
+        _, actions = hamiltonian_cycle(dimensions)
+        for fraction in length_fractions:
+            length = max(int(size * size * fraction), 1)
+            game = snake_game(dimensions, length, seed)
+            step = 0
+
+            def run_step():
+                nonlocal game, step
+                # eating grows the snake until it fills the board, start over at the original length
+                if game.done:
+                    game = snake_game(dimensions, length, seed)
+                    step = 0
+                game.step(actions[step % len(actions)])
+                step += 1
+
+            calls, elapsed = time_calls(run_step, min_time)
+            results.append({"board_size": size, "snake_length": length, "steps": calls, "steps_per_second": calls / elapsed})
+    return results
+
+def grown_agent(num_inputs: int, num_outputs: int, hidden_nodes: int, connections: int, neat: NEAT) -> Agent:
+    """ an agent mutated until it has the given number of hidden nodes and at least the given number of connections """
+    agent = Agent(num_inputs, num_outputs)
+    agent.add_connection(neat.innovations)
+    for _ in range(hidden_nodes):
+        agent.add_node(neat.innovations)
+    while len(agent.genes) < connections:
+        agent.add_connection(neat.innovations)
+    return agent
+
+def bench_get_action(hidden_node_counts: list[int], connection_counts: list[int], min_time: float, seed: int) -> list[dict]:
+    """ Agent.get_action latency against hidden node and connection count, compile time reported separately """
+    num_inputs, num_outputs = 100, 4
+    neat = NEAT(0, num_inputs, num_outputs)
+    state = np.random.default_rng(seed).integers(-1, 2, num_inputs).astype(np.float64)
+    results = []
+    for hidden_nodes in hidden_node_counts:
+        for connections in connection_counts:
+            if connections < 2 * hidden_nodes + 1:
+                continue
+            random.seed(seed)
+            agent = grown_agent(num_inputs, num_outputs, hidden_nodes, connections, neat)
+            start = time.perf_counter()
+            agent.compile()
+            compile_time = time.perf_counter() - start
+
+            calls, elapsed = time_calls(lambda: agent.get_action(state), min_time)
+            results.append({
+                "hidden_nodes": hidden_nodes,
+                "connections": int(len(agent.genes)),
+                "layers": len(agent.phenotype.layers),
+                "compile_seconds": compile_time,
+                "latency_seconds": elapsed / calls,
+            })
+    return results
+
+def mutated_neat(num_agents: int, mutations: int, seed: int) -> NEAT:
+    """ a population grown by a few rounds of mutation, with seeded random fitness """
+    random.seed(seed)
+    neat = NEAT(num_agents, 100, 4)
+    for _ in range(mutations):
+        neat.mutate()
+    for agent in neat.agents:
+        agent.fitness = random.randint(0, 20)
+    return neat
+
+def bench_generation(population_sizes: list[int], mutations: int, repeats: int, seed: int) -> list[dict]:
+    """ NEAT.speciate_agents and NEAT.next_generation time against population size, median of the repeats """
+    results = []
+    for num_agents in population_sizes:
+        speciate_times, generation_times = [], []
+        for repeat in range(repeats):
+            neat = mutated_neat(num_agents, mutations, seed + repeat)
+            start = time.perf_counter()
+            neat.speciate_agents()
+            speciate_times.append(time.perf_counter() - start)
+            num_species = len(neat.species)
+
+            neat = mutated_neat(num_agents, mutations, seed + repeat)
+            start = time.perf_counter()
+            neat.next_generation()
+            generation_times.append(time.perf_counter() - start)
+        results.append({
+            "population": num_agents,
+            "species": num_species,
+            "speciate_seconds": statistics.median(speciate_times),
+            "next_generation_seconds": statistics.median(generation_times),
+        })
+    return results
+
+def bench_end_to_end(num_agents: int, generations: int, workers: int, lockstep: bool, seed: int) -> dict:
+    """ full generations, evaluation included, on a 10x10 board """
+    dimensions = (10, 10)
+    random.seed(seed)
+    neat = NEAT(num_agents, dimensions[0] * dimensions[1], 4)
+    evaluator = Evaluator(dimensions, workers, lockstep=lockstep, max_steps=1000, starvation_limit=200, detect_loops=not lockstep)
+
+    start = time.perf_counter()
+    evaluate_time = 0.0
+    for generation in range(generations):
+        evaluate_start = time.perf_counter()
+        fitness = evaluator.evaluate(neat.agents, seed=seed + generation)
+        evaluate_time += time.perf_counter() - evaluate_start
+        for agent, agent_fitness in zip(neat.agents, fitness):
+            agent.fitness = agent_fitness
+        neat.next_generation()
+    elapsed = time.perf_counter() - start
+    evaluator.close()
+
+    return {
+        "population": num_agents,
+        "generations": generations,
+        "workers": workers,
+        "lockstep": lockstep,
+        "evaluate_seconds": evaluate_time,
+        "total_seconds": elapsed,
+        "generations_per_minute": generations * 60 / elapsed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON results")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and shorter timings, for a fast regression check")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the end to end benchmark")
+    args = parser.parse_args()
+
+    if args.quick:
+        min_time = 0.1
+        board_sizes, length_fractions = [10, 20], [0.0, 0.5]
+        hidden_node_counts, connection_counts = [0, 10], [10, 50]
+        population_sizes, repeats = [100, 300], 1
+        end_to_end = (100, 3)
+    else:
+        min_time = 0.5
+        board_sizes, length_fractions = [10, 20, 40], [0.0, 0.25, 0.5, 0.9]
+        hidden_node_counts, connection_counts = [0, 10, 50, 200], [10, 100, 500, 1000]
+        population_sizes, repeats = [100, 300, 1000, 3000], 3
+        end_to_end = (300, 10)
+
+    results = {
+        "meta": {
+            "seed": args.seed,
+            "quick": args.quick,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "game_step": bench_game_step(board_sizes, length_fractions, min_time, args.seed),
+        "get_action": bench_get_action(hidden_node_counts, connection_counts, min_time, args.seed),
+        "generation": bench_generation(population_sizes, 2, repeats, args.seed),
+        "end_to_end": [bench_end_to_end(*end_to_end, 1, False, args.seed), bench_end_to_end(*end_to_end, 1, True, args.seed)],
+    }
+    if args.workers > 1:
+        results["end_to_end"].append(bench_end_to_end(*end_to_end, args.workers, False, args.seed))
+
+    with open(args.output, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
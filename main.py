@@ -1,70 +1,113 @@
 #!/usr/bin/env python3
-import random
-import time
+import os
 
+from Checkpoint import load_checkpoint, save_checkpoint
+from Encoders import BoardEncoder
+from Evaluation import Evaluator
 from Game import Game
 from NEAT import NEAT
+from Replay import load_episodes, record_game, save_episodes
+from Settings import Settings
+from Telemetry import JSONLSink, Telemetry
+from Viewer import Viewer
 
-dimensions = (10, 10)
-env = Game(dimensions)
-num_actions = 4
-
-agents = 100
-inputs = dimensions[0] * dimensions[1]
-outputs = num_actions
-neat = NEAT(agents, inputs, outputs)
-
-generations = 10000
-render_period = 1
-render = True
-
-for generation in range(generations):
-    print(f"### GENERATION {generation} ###")
-
-    # each agent plays a full game
-    for i, agent in enumerate(neat.agents):
-
-        # game loop
-        state = env.reset()
-        while not env.done:
-            # get action
-            action = agent.get_action(state.flatten(), neat.connections)
-            #action = random.randint(0, num_actions-1)
-            #action = int(input("action: "))
-
-            # preform action and get new state and rewards
-            new_state = env.step(action)
-
-            # update state for next loop
-            state = new_state
-
-        agent.fitness = env.points
-
-    neat.next_generation()
-
-    # print data on species
-    for i, specie in enumerate(neat.species):
-        print(f'specie #{i} size: {len(specie)}')
-    print(f'agents: {len(neat.agents)}')
-
-    # showcase best agent every 50 gens
-    if generation % 50 == 0:
-        # select fittest agent
-        max_fitness = -1
-        fittest_agent = None
-        for agent in neat.agents:
-            if agent.fitness > max_fitness:
-                max_fitness = agent.fitness
-                fittest_agent = agent
-        print(f"Best Score: {max_fitness}")
-
-        # showcase fittest agent playing game
-        state = env.reset()
-        env.render()
-        while not env.done:
-            env.render()
-            time.sleep(0.1) #helps view game at normal speed
-            action = fittest_agent.get_action(state.flatten(), neat.connections)
-            new_state = env.step(action)
-            state = new_state
+def main(generations: int = 10000, render: bool = True):
+    """ train on a 10x10 board, generations and render can be lowered for a quick headless run """
+    dimensions = (10, 10)
+    num_actions = 4
 
+    # bound every game so circling agents cannot stall a generation
+    max_steps = 1000
+    starvation_limit = dimensions[0] * dimensions[1] * 2
+    detect_loops = True
+
+    # network inputs: the whole board, or a compact DangerEncoder, RayEncoder or WindowEncoder
+    encoder = BoardEncoder()
+
+    agents = 100
+    inputs = encoder.num_inputs(dimensions)
+    outputs = num_actions
+
+    # activation of every hidden and output node in the first generation, see Activations.ACTIVATIONS
+    activation = "sigmoid"
+
+    # checkpoint every generation, and resume from the last one if it exists
+    checkpoint_path = "neat_checkpoint.npz"
+    checkpoint_period = 1
+    start_generation = 0
+    if os.path.exists(checkpoint_path):
+        neat, start_generation = load_checkpoint(checkpoint_path)
+        print(f"resuming from generation {start_generation}")
+    else:
+        neat = NEAT(agents, inputs, outputs, activation)
+
+    # evaluation: spread games over worker processes, or play them all at once in lockstep, which needs detect_loops off
+    workers = os.cpu_count()
+    chunk_size = None
+    lockstep = False
+
+    # fitness: rewards from Settings averaged over a few episodes, every agent playing the same seeds
+    settings = Settings()
+    num_episodes = 3
+    aggregate = "mean"
+
+    # the same seeds are played for seed_period generations, so elites carried over unchanged
+    # and duplicate genomes get their game results from the cache instead of playing again
+    seed_period = 10
+    cache_size = 10000
+    evaluator = Evaluator(dimensions, workers, chunk_size, lockstep, max_steps, starvation_limit, detect_loops, encoder,
+                          num_episodes, aggregate, settings=settings, cache_size=cache_size)
+
+    # per generation phase timings, game lengths, end reasons and network sizes, appended to a JSONL file
+    telemetry = Telemetry(enabled=True)
+    telemetry.add_hook(JSONLSink("telemetry.jsonl"))
+    neat.telemetry = telemetry
+
+    # every generation's best game is recorded as its seed and actions, saved with each checkpoint
+    episodes_path = "champions.npz"
+    champion_episodes = load_episodes(episodes_path) if os.path.exists(episodes_path) else []
+    record_env = Game(dimensions, **evaluator.game_options)
+
+    # best agents are shown by a separate viewer process, training never waits on it
+    render_period = 50
+    viewer = Viewer(dimensions, evaluator.game_options, inputs, outputs) if render else None
+
+    for generation in range(start_generation, generations):
+        print(f"### GENERATION {generation} ###")
+
+        # each agent plays its episodes
+        seed = generation // seed_period * evaluator.episodes
+        with telemetry.phase("evaluation"):
+            fitness = evaluator.evaluate(neat.agents, seed=seed)
+        for agent, agent_fitness in zip(neat.agents, fitness):
+            agent.fitness = agent_fitness
+
+        telemetry.record("best_fitness", max(fitness))
+
+        # showcase the best agent's first scored game before it reproduces and mutates
+        best = max(range(len(fitness)), key=fitness.__getitem__)
+        best_seed = seed
+        print(f"Best Score: {fitness[best]}")
+        champion_episodes.append(record_game(record_env, neat.agents[best].compile(), best_seed))
+        if viewer is not None and generation % render_period == 0:
+            viewer.show(neat.agents[best], seed=best_seed)
+
+        neat.next_generation()
+        telemetry.end_generation(generation, neat, evaluator)
+        if (generation + 1) % checkpoint_period == 0:
+            save_checkpoint(neat, checkpoint_path, generation + 1)
+            save_episodes(episodes_path, champion_episodes)
+
+        # print data on species
+        for i, specie in enumerate(neat.species):
+            print(f'specie #{i} size: {len(specie)}')
+        print(f'agents: {len(neat.agents)}')
+
+    evaluator.close()
+    neat.close()
+    telemetry.close()
+    if viewer is not None:
+        viewer.close()
+
+if __name__ == "__main__":
+    main()
@@ -29,15 +29,13 @@ for i in range(gens):
 for i, agent in enumerate(neat.agents):
     print(f'agent: {i}')
     print('\tNodes:')
-    for _, node in agent.nodes.items():
-        print(f'\t\t{node.id} {node.node_type} connections:\n\t\t\tin: {node.in_connections}\n\t\t\tout: {node.out_connections}')
+    for node_id in agent.get_node_ids():
+        print(f'\t\t{node_id} {agent.get_node_type(node_id)}')
     print('\tConnections:')
-    for _, connection in agent.connections.items():
-        print(f'\t\tenabled: {connection.enabled} out: {connection.out_node.id} in: {connection.in_node.id} inno: {connection.innovation_number}' )
+    for gene in agent.genes:
+        print(f'\t\tenabled: {gene["enabled"]} out: {gene["out_node"]} in: {gene["in_node"]} inno: {gene["innovation"]}' )
 
 
-for out_node, in_conns in neat.connections.items():
-    print(f'Node: {out_node} Connections:')
-    for in_node, inno_num in in_conns.items():
-        print(f'\tIn node: {in_node}, inno_num: {inno_num}')
+for (in_node, out_node), inno_num in neat.innovations.innovations.items():
+    print(f'Innovation: {inno_num} out node: {out_node} in node: {in_node}')
 """
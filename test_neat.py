@@ -0,0 +1,51 @@
+import random
+
+from NEAT import NEAT, Agent
+
+def test_fitter_species_gets_more_offspring():
+    random.seed(0)
+    neat = NEAT(0, 4, 2)
+    neat.num_agents = 12
+    neat.species = []
+    for fitness in (20, 10, 0):
+        specie = [Agent(4, 2) for _ in range(2)]
+        for agent in specie:
+            agent.fitness = fitness
+        neat.species.append(specie)
+    neat.agents = [agent for specie in neat.species for agent in specie]
+
+    counts = neat.allocate_offspring()
+    assert sum(counts) == neat.num_agents
+    assert counts[0] > counts[1] > counts[2] == 0
+
+def test_champion_carries_over_unchanged():
+    random.seed(1)
+    neat = NEAT(100, 10, 4)
+    for _ in range(3):
+        neat.mutate()
+    for _ in range(5):
+        for agent in neat.agents:
+            agent.fitness = random.random()
+        champion = max(neat.agents, key=lambda agent: agent.fitness).genome_hash()
+        neat.next_generation()
+        assert len(neat.agents) == neat.num_agents
+        assert champion in {agent.genome_hash() for agent in neat.agents}
+
+def test_champion_kept_when_its_species_gets_one_slot():
+    random.seed(2)
+    neat = NEAT(15, 4, 2)
+    neat.num_agents = 10
+    # the champion's species is weak on average, so it is only given a single agent
+    champion, weak, strong = neat.agents[0], neat.agents[1:10], neat.agents[10:]
+    champion.fitness = 1.0
+    for agent in weak:
+        agent.fitness = 0.0
+    for agent in strong:
+        agent.fitness = 0.9
+    neat.species = [[champion] + weak, strong]
+    neat.agents = neat.species[0] + strong
+    assert neat.allocate_offspring()[0] == 1
+
+    offspring = neat.reproduce()
+    kept = neat.species[0][0]
+    assert kept not in offspring and kept.genome_hash() == champion.genome_hash()
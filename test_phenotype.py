@@ -0,0 +1,109 @@
+import random
+import numpy as np
+
+from Activations import sigmoid
+from NEAT import NEAT
+from Phenotype import Phenotype
+
+def reference_forward(num_inputs: int, num_outputs: int, out_nodes, in_nodes, weights, state: np.ndarray) -> np.ndarray:
+    """ evaluate an acyclic genome node by node from its connections, without compiling or pruning it """
+    incoming = {}
+    for out_node, in_node, weight in zip(out_nodes, in_nodes, weights):
+        incoming.setdefault(in_node, []).append((out_node, weight))
+
+    values = {}
+    def value(node: int) -> float:
+        if node <= num_inputs:
+            return state[node - 1]
+        if node not in values:
+            values[node] = sigmoid(sum(weight * value(source) for source, weight in incoming.get(node, [])))
+        return values[node]
+
+    return np.array([value(node) for node in range(num_inputs + 1, num_inputs + num_outputs + 1)])
+
+def random_genome(num_inputs: int, num_outputs: int, num_hidden: int, num_connections: int, rng: random.Random,
+                  cycles: bool) -> (list, list, list):
+    """ connections between random nodes, running from earlier to later nodes of a random order unless cycles is set """
+    hidden = list(range(num_inputs + num_outputs + 1, num_inputs + num_outputs + num_hidden + 1))
+    outputs = list(range(num_inputs + 1, num_inputs + num_outputs + 1))
+    order = list(range(1, num_inputs + 1)) + rng.sample(hidden, len(hidden)) + outputs
+    connections = set()
+    while len(connections) < num_connections:
+        i, j = rng.randrange(len(order)), rng.randrange(num_inputs, len(order))
+        if i == j or (not cycles and i > j):
+            continue
+        connections.add((order[i], order[j]))
+    out_nodes, in_nodes = map(list, zip(*sorted(connections)))
+    weights = [rng.uniform(-2, 2) for _ in connections]
+    return out_nodes, in_nodes, weights
+
+def reaches(out_nodes, in_nodes, start: int, goal: int) -> bool:
+    """ whether a path of connections leads from start to goal """
+    seen, stack = {start}, [start]
+    while stack:
+        node = stack.pop()
+        if node == goal:
+            return True
+        for out_node, in_node in zip(out_nodes, in_nodes):
+            if out_node == node and in_node not in seen:
+                seen.add(in_node)
+                stack.append(in_node)
+    return False
+
+def test_acyclic_matches_reference():
+    rng = random.Random(0)
+    for _ in range(50):
+        genome = random_genome(5, 3, 6, 20, rng, cycles=False)
+        phenotype = Phenotype(5, 3, *genome)
+        for _ in range(3):
+            state = np.array([rng.uniform(-1, 1) for _ in range(5)])
+            np.testing.assert_allclose(phenotype.forward(state), reference_forward(5, 3, *genome, state))
+
+def test_cycle_upstream_of_output_keeps_feed_forward_edges():
+    # 4 and 5 form a cycle feeding 3, which feeds output 2, only 5 -> 4 closes the cycle
+    phenotype = Phenotype(1, 1, [1, 4, 5, 4, 3], [4, 5, 4, 3, 2], [1, 1, 1, 5, 5])
+    for x in (-1.0, 0.0, 1.0):
+        state = np.array([x])
+        np.testing.assert_allclose(phenotype.forward(state), reference_forward(1, 1, [1, 4, 4, 3], [4, 5, 3, 2], [1, 1, 5, 5], state))
+
+def test_only_cycle_edges_are_dropped():
+    rng = random.Random(1)
+    for _ in range(50):
+        out_nodes, in_nodes, weights = random_genome(4, 2, 6, 24, rng, cycles=True)
+        phenotype = Phenotype(4, 2, out_nodes, in_nodes, weights)
+
+        node_ids = np.union1d(np.arange(1, 7), out_nodes + in_nodes)
+        layers, recurrent = phenotype.topological_layers(len(node_ids), np.searchsorted(node_ids, out_nodes),
+                                                         np.searchsorted(node_ids, in_nodes))
+        # the rest is acyclic: every non input node gets a layer
+        assert sum(len(layer) for layer in layers) == len(node_ids) - 4
+        for edge in np.flatnonzero(recurrent):
+            assert reaches(out_nodes, in_nodes, in_nodes[edge], out_nodes[edge])
+
+        kept = ~recurrent
+        genome = [list(np.array(genes)[kept]) for genes in (out_nodes, in_nodes, weights)]
+        state = np.array([rng.uniform(-1, 1) for _ in range(4)])
+        np.testing.assert_allclose(phenotype.forward(state), reference_forward(4, 2, *genome, state))
+
+def test_pruning_matches_unpruned_cyclic_genomes():
+    random.seed(2)
+    neat = NEAT(100, 10, 4)
+    for _ in range(25):
+        neat.mutate()
+    state = np.random.default_rng(2).uniform(-1, 1, 10)
+    num_cyclic = 0
+    for agent in neat.agents:
+        out_nodes, in_nodes, weights = agent.get_genome()
+        keep = in_nodes > 10
+        out_nodes, in_nodes, weights = out_nodes[keep], in_nodes[keep], weights[keep]
+        phenotype = agent.compile()
+
+        # back edges of the whole genome, dead structure included
+        node_ids = np.union1d(np.arange(1, 15), np.concatenate((out_nodes, in_nodes)))
+        _, recurrent = phenotype.topological_layers(len(node_ids), np.searchsorted(node_ids, out_nodes),
+                                                    np.searchsorted(node_ids, in_nodes))
+        num_cyclic += recurrent.any()
+        kept = ~recurrent
+        expected = reference_forward(10, 4, out_nodes[kept], in_nodes[kept], weights[kept], state)
+        np.testing.assert_allclose(phenotype.forward(state), expected)
+    assert num_cyclic > 0